@@ -11,12 +11,11 @@ from flask import (
 
 from forms import CampsiteForm, LoginForm
 from models import Campsite, User
-import requests
 import json
 import logging
 import re
 from dotenv import load_dotenv
-from line_bot import verify_signature, handle_message, handle_postback
+from line_bot import verify_signature, handle_message, handle_postback, handle_location
 from bson import ObjectId
 from bson.errors import InvalidId
 import os
@@ -29,6 +28,19 @@ from flask_login import (
     current_user,
 )
 from sitemap import sitemap_bp  # 導入 sitemap 藍圖
+from assets import init_assets
+from http_cache import init_http_cache, conditional_page
+from page_cache import init_page_cache, cached_page
+from image_service import image_bp, proxied_image_url
+from thumbnails import PUBLIC_BASE_URL, thumbnail_url
+from carriers import normalize_carriers
+from geography import COUNTY_GROUPS
+from geocode import parse_coordinates
+from facets import web_facet_counts, visible_option_groups
+from ranking import rank
+from suggest import suggest
+from search_telemetry import record_search, search_telemetry
+from cache_warmer import WARMUP_ENVIRON_KEY, start_warmup, warmup_status
 
 # 載入環境變數
 load_dotenv()
@@ -53,6 +65,12 @@ def load_user(username):
 
 
 app.register_blueprint(sitemap_bp)
+app.register_blueprint(image_bp)
+init_assets(app)
+init_http_cache(app)
+init_page_cache(app)
+app.jinja_env.globals["thumbnail_url"] = thumbnail_url
+app.jinja_env.globals["proxied_image_url"] = proxied_image_url
 
 
 @app.route("/robots.txt")
@@ -78,6 +96,8 @@ def callback():
         for event in events:
             if event["type"] == "message" and event["message"]["type"] == "text":
                 handle_message(event, Campsite)
+            elif event["type"] == "message" and event["message"]["type"] == "location":
+                handle_location(event, Campsite)
             elif event["type"] == "postback":
                 handle_postback(event, Campsite)
 
@@ -87,14 +107,45 @@ def callback():
         abort(500)
 
 
+SORT_OPTIONS = ("relevance", "distance", "name", "location", "altitude")
+NEAREST_LIMIT = 60  # 「附近的營地」最多列出的營地數
+
+
+def index_params():
+    """正規化首頁查詢參數：(頁碼, 關鍵字, 排序, 地區, 寵物, 位置)"""
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+    except ValueError:
+        page = 1
+    q = " ".join(request.args.get("q", "").split())
+    # 座標取到小數第三位（約百公尺），相近位置共用頁面快取
+    near = parse_coordinates(request.args.get("lat"), request.args.get("lng"))
+    if near:
+        near = (round(near[0], 3), round(near[1], 3))
+    # 有位置時預設依距離、有關鍵字時預設依相關性排序
+    sort_by = request.args.get("sort", "distance" if near else "relevance" if q else "name")
+    if (
+        sort_by not in SORT_OPTIONS
+        or (sort_by == "relevance" and not q)
+        or (sort_by == "distance" and not near)
+    ):
+        sort_by = "name"
+    return (
+        page,
+        q,
+        sort_by,
+        request.args.get("region", "").strip(),
+        request.args.get("pets", "").strip(),
+        near,
+    )
+
+
 @app.route("/")
+@conditional_page
+@cached_page(index_params)
 def index():
-    page = int(request.args.get("page", 1))
+    page, q, sort_by, region, pet_friendly, near = index_params()
     per_page = 12
-    q = request.args.get("q", "")
-    sort_by = request.args.get("sort", "name")
-    region = request.args.get("region", "")
-    pet_friendly = request.args.get("pets", "")
 
     # 建構搜尋條件
     search_query = q
@@ -104,12 +155,24 @@ def index():
         search_query += f" {pet_friendly}"
 
     # 使用優化的查詢
-    if search_query.strip():
+    if near:
+        # 附近的營地：依距離排序，有搜尋條件時只保留符合的營地
+        campsites_all = Campsite.nearest(near[0], near[1], limit=NEAREST_LIMIT)
+        if search_query.strip():
+            matched = {c["_id"] for c in Campsite.search_by_keywords(search_query.strip())}
+            campsites_all = [c for c in campsites_all if c["_id"] in matched]
+    elif search_query.strip():
+        if page == 1 and not request.environ.get(WARMUP_ENVIRON_KEY):
+            record_search(search_query)
         # 搜尋模式：使用快取的搜尋結果
         campsites_all = Campsite.search_by_keywords(search_query.strip())
-        
+
+    if near or search_query.strip():
         # 排序功能
-        if sort_by == "altitude":
+        if sort_by == "relevance":
+            # 只排序到目前頁面為止的前幾筆
+            campsites_all = rank(campsites_all, q, limit=page * per_page)
+        elif sort_by == "altitude":
             campsites_all = sorted(campsites_all, key=lambda x: int(re.search(r'\d+', x.get('altitude', '0')).group()) if re.search(r'\d+', x.get('altitude', '0')) else 0)
         elif sort_by == "name":
             campsites_all = sorted(campsites_all, key=lambda x: x.get('name', ''))
@@ -141,13 +204,8 @@ def index():
             total = result['total']
             total_pages = result['total_pages']
 
-    # 取得篩選選項 - 使用快取的台灣縣市列表
-    taiwan_counties = [
-        "台北市", "新北市", "桃園市", "台中市", "台南市", "高雄市",
-        "基隆市", "新竹市", "嘉義市",
-        "新竹縣", "苗栗縣", "彰化縣", "南投縣", "雲林縣", "嘉義縣",
-        "屏東縣", "宜蘭縣", "花蓮縣", "台東縣", "澎湖縣", "金門縣", "連江縣"
-    ]
+    # 篩選選項的營地數，計數為 0 的選項不顯示
+    facet_counts = web_facet_counts(q, region, pet_friendly)
 
     return render_template(
         "index.html",
@@ -158,8 +216,31 @@ def index():
         sort_by=sort_by,
         region=region,
         pet_friendly=pet_friendly,
-        regions=taiwan_counties,
+        county_groups=visible_option_groups(
+            COUNTY_GROUPS, facet_counts["county"] if facet_counts else None, region
+        ),
+        facet_counts=facet_counts,
         total_campsites=total,
+        near_args={"lat": near[0], "lng": near[1]} if near else {},
+    )
+
+
+@app.route("/campsite/<id>")
+@conditional_page
+@cached_page(lambda: request.view_args["id"])
+def campsite_detail(id):
+    try:
+        object_id = ObjectId(id)
+    except InvalidId:
+        abort(404)
+
+    campsite = Campsite.get_by_id(object_id)
+    if not campsite:
+        abort(404)
+    return render_template(
+        "campsite.html",
+        campsite=campsite,
+        canonical_url=f"{PUBLIC_BASE_URL}/campsite/{object_id}",
     )
 
 
@@ -210,10 +291,7 @@ def edit_campsite(id):
             if field == "image_url" and "image_urls" in campsite:
                 form._fields[field].data = ", ".join(campsite["image_urls"])
             elif field == "signal_strength" and "signal_strength" in campsite:
-                if isinstance(campsite["signal_strength"], str):
-                    form._fields[field].data = [s.strip() for s in campsite["signal_strength"].split(",")]
-                else:
-                    form._fields[field].data = campsite["signal_strength"]
+                form._fields[field].data = normalize_carriers(campsite["signal_strength"])
             elif field in campsite:
                 form._fields[field].data = campsite[field]
 
@@ -252,25 +330,13 @@ def delete_campsite(id):
     return redirect(url_for("index"))
 
 
-@app.route("/image_proxy")
-def image_proxy():
-    image_url = request.args.get("url")
-    if not image_url:
-        return "缺少圖片 URL", 400
-
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(image_url, headers=headers, stream=True)
-    if response.status_code == 200:
-        return Response(response.content, content_type=response.headers["Content-Type"])
-    else:
-        return "圖片無法載入", response.status_code
-
-
 @app.route("/update_data")
 @login_required
 def update_data():
     try:
         save_campsite()
+        # 大量資料變更後在背景重新預熱快取
+        start_warmup("營區資料更新")
         flash("營區資料已更新！", "success")
     except Exception as e:
         logger.error(f"更新營區資料時發生錯誤: {str(e)}")
@@ -278,6 +344,18 @@ def update_data():
     return redirect(url_for("index"))
 
 
+@app.route("/suggest")
+def suggest_keywords():
+    """搜尋框的輸入建議（每次按鍵呼叫，回應保持精簡）"""
+    q = request.args.get("q", "")[:100]
+    try:
+        suggestions = suggest(q)
+    except Exception as e:
+        logger.error(f"取得搜尋建議時發生錯誤: {str(e)}")
+        suggestions = []
+    return {"q": q, "suggestions": suggestions}, 200, {"Cache-Control": "public, max-age=60"}
+
+
 @app.route("/health")
 def health_check():
     return {"status": "healthy"}, 200
@@ -288,9 +366,30 @@ def health_check():
 def cache_stats():
     """快取統計資訊（僅限管理員）"""
     from cache_manager import CacheManager
+    from image_cache import image_cache
+    from page_cache import page_cache, fragment_cache
+    from migrations import schema_status
     stats = CacheManager.get_cache_stats()
     return {
         "cache_stats": stats,
+        "image_cache_stats": image_cache.stats(),
+        "page_cache_stats": page_cache.stats(),
+        "fragment_cache_stats": fragment_cache.stats(),
+        "search_telemetry": search_telemetry.stats(),
+        "cache_warmup": warmup_status(),
+        "schema": schema_status(),
+        "status": "success"
+    }, 200
+
+
+@app.route("/line/stats")
+@login_required
+def line_stats():
+    """LINE 回覆 API 統計資訊（僅限管理員）"""
+    from line_bot import reply_client, outbound_dispatcher
+    return {
+        "reply_stats": reply_client.stats(),
+        "push_stats": outbound_dispatcher.stats(),
         "status": "success"
     }, 200
 
@@ -300,7 +399,9 @@ def cache_stats():
 def clear_cache():
     """清除快取（僅限管理員）"""
     from models import cache
+    from page_cache import clear_page_caches
     cache.clear()
+    clear_page_caches()
     flash("快取已清除", "success")
     return redirect(url_for("index"))
 
@@ -309,9 +410,10 @@ def clear_cache():
 @login_required
 def warmup_cache():
     """預熱快取（僅限管理員）"""
-    from cache_manager import CacheManager
-    result = CacheManager.warm_up_cache()
-    flash(result, "success")
+    if start_warmup("管理員手動預熱", delay=0):
+        flash("已開始在背景預熱快取", "success")
+    else:
+        flash("快取預熱已在執行中，完成後會再執行一次", "info")
     return redirect(url_for("index"))
 
 
@@ -355,5 +457,9 @@ def google_search_console():
 
 
 if __name__ == "__main__":
+    from line_bot import validate_templates
+    from migrations import check_schema
+    validate_templates()
+    check_schema()
     port = int(os.getenv("PORT", 13215))
     app.run(host="0.0.0.0", port=port, debug=False)
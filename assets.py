@@ -0,0 +1,86 @@
+"""
+靜態資源網址與快取
+url_for('static') 自動改用 build_assets.py 產生的雜湊檔名，
+雜湊檔以 immutable 快取並優先回應預先壓縮的版本
+"""
+
+import os
+import json
+import logging
+import mimetypes
+
+from flask import request, send_file, abort, url_for
+from werkzeug.utils import safe_join
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# 依偏好順序排列的預先壓縮格式
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def load_manifest(static_folder: str) -> dict:
+    """讀取 build_assets.py 產生的 manifest，尚未建置時回傳空字典"""
+    path = os.path.join(static_folder, "dist", "manifest.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.info("尚未建置靜態資源，使用原始檔案")
+        return {}
+
+
+def init_assets(app):
+    """註冊雜湊網址、immutable 靜態檔案與樣板輔助函數"""
+    manifest = load_manifest(app.static_folder)
+    app.extensions["asset_manifest"] = manifest
+    original_static = app.view_functions["static"]
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == "static" and values.get("filename") in manifest:
+            values["filename"] = manifest[values["filename"]]
+
+    def static(filename):
+        if not filename.startswith("dist/"):
+            return original_static(filename=filename)
+        return _send_hashed(app.static_folder, filename)
+
+    app.view_functions["static"] = static
+
+    def vendor_url(filename: str, cdn_url: str) -> str:
+        """已建置時使用本機的第三方資源，否則退回 CDN"""
+        if filename in manifest:
+            return url_for("static", filename=filename)
+        return cdn_url
+
+    def webp_url(filename: str):
+        """圖片的 WebP 版本網址，尚未建置時回傳 None"""
+        webp_name = os.path.splitext(filename)[0] + ".webp"
+        if webp_name in manifest:
+            return url_for("static", filename=webp_name)
+        return None
+
+    app.jinja_env.globals.update(vendor_url=vendor_url, webp_url=webp_url)
+
+
+def _send_hashed(static_folder: str, filename: str):
+    """回應加上雜湊的檔案，內容永不改變因此可永久快取"""
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    encoding = None
+    for name, suffix in PRECOMPRESSED:
+        if name in request.accept_encodings and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, name
+            break
+
+    response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,116 @@
+"""
+結構化條件的記憶體欄位索引
+每個區域、縣市、寵物、通訊與停車條件各有一個 NumPy 布林陣列，海拔為整數陣列，
+搜尋時以向量化的 AND 運算取得符合的營地 _id，取代資料庫逐筆比對 regex
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 未安裝 NumPy 時改用資料庫查詢
+    np = None
+
+from carriers import normalize_carriers
+from geography import classify_location, county_members
+from search_filters import HIGH_ALTITUDE, altitude_value, field_text, parking_matches, pet_options
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_ALTITUDE = -1
+
+
+class AttributeStore:
+    """營地結構化屬性的欄位式儲存，資料變更後整個重建"""
+
+    def __init__(self, campsites: List[Dict[str, Any]]):
+        self.size = len(campsites)
+        self.ids = np.empty(self.size, dtype=object)
+        self.altitude = np.full(self.size, UNKNOWN_ALTITUDE, dtype=np.int32)
+        self.columns: Dict[Tuple[str, Any], "np.ndarray"] = {}
+
+        columns = {}
+
+        def mark(key, position):
+            columns.setdefault(key, []).append(position)
+
+        for i, campsite in enumerate(campsites):
+            self.ids[i] = campsite["_id"]
+            value = altitude_value(campsite.get("altitude"))
+            if value is not None:
+                self.altitude[i] = value
+
+            place = classify_location(field_text(campsite.get("location")))
+
+            if place["region"]:
+                mark(("region", place["region"]), i)
+            if place["county"]:
+                mark(("county", place["county"]), i)
+            for option in pet_options(campsite):
+                mark(("pets", option), i)
+            for carrier in normalize_carriers(campsite.get("signal_strength")):
+                mark(("signal", carrier), i)
+            for match in parking_matches(campsite):
+                mark(("parking", match), i)
+
+        for key, positions in columns.items():
+            column = np.zeros(self.size, dtype=bool)
+            column[positions] = True
+            self.columns[key] = column
+
+    def mask(self, region: Optional[str] = None, county: Optional[str] = None,
+             altitude: Optional[str] = None,
+             pets: Optional[str] = None, signal: Optional[str] = None,
+             parking: Optional[Tuple[str, str]] = None) -> "np.ndarray":
+        """符合所有條件的營地布林陣列，條件格式與 parse_search_keywords 相同"""
+        result = np.ones(self.size, dtype=bool)
+        for key in (("region", region), ("pets", pets), ("signal", signal), ("parking", parking)):
+            if key[1] is None:
+                continue
+            column = self.columns.get(key)
+            if column is None:
+                return np.zeros(self.size, dtype=bool)
+            result &= column
+        if county is not None:
+            # 「新竹」等關鍵字涵蓋多個縣市，取聯集
+            any_county = np.zeros(self.size, dtype=bool)
+            for member in county_members(county):
+                column = self.columns.get(("county", member))
+                if column is not None:
+                    any_county |= column
+            result &= any_county
+        if altitude == "高海拔":
+            result &= self.altitude >= HIGH_ALTITUDE
+        elif altitude == "低海拔":
+            result &= (self.altitude >= 0) & (self.altitude < HIGH_ALTITUDE)
+        return result
+
+    def filter(self, **filters) -> List[Any]:
+        """符合條件的營地 _id"""
+        return self.ids[self.mask(**filters)].tolist()
+
+
+_store = {"version": None, "value": None}
+_store_lock = threading.Lock()
+
+
+def get_attribute_store() -> Optional[AttributeStore]:
+    """取得目前資料版本的欄位索引，未安裝 NumPy 或建立失敗時回傳 None"""
+    if np is None:
+        return None
+    from models import Campsite, get_data_version
+
+    try:
+        version = get_data_version()
+        if _store["version"] != version:
+            with _store_lock:
+                if _store["version"] != version:
+                    _store["value"] = AttributeStore(Campsite.get_facet_fields())
+                    _store["version"] = version
+                    logger.info(f"欄位索引已重建: {_store['value'].size} 個營地")
+        return _store["value"]
+    except Exception as e:
+        logger.warning(f"建立欄位索引失敗，改用資料庫查詢: {e}")
+        return None
@@ -0,0 +1,136 @@
+"""
+結構化條件搜尋效能比較
+以合成營地資料比較逐筆 regex 比對（資料庫查詢的作法）與 NumPy 欄位索引
+
+使用方式:
+    python benchmark_filters.py                # 記憶體內比較 1k / 10k / 100k 筆
+    python benchmark_filters.py --mongo        # 另外寫入暫存集合，比較實際的資料庫查詢
+"""
+
+import re
+import time
+import random
+import argparse
+
+from bson import ObjectId
+
+from attribute_store import AttributeStore
+from carriers import normalize_carriers
+from geography import COUNTIES
+from search_filters import altitude_band, mongo_conditions, parse_search_keywords
+
+SIZES = (1_000, 10_000, 100_000)
+QUERIES = (
+    "中部 高海拔",
+    "北部 可帶寵物 中華",
+    "南部 集中停車 遠傳",
+    "東部 低海拔 不可帶寵物 車邊",
+    "新竹 高海拔",
+)
+SIGNALS = ["中華電信有訊號", "遠傳有訊號", "台哥大有訊號", "亞太有訊號", "WIFI", "無資訊"]
+
+
+def synthetic_campsites(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield {
+            "_id": ObjectId(),
+            "name": f"營地{rng.randrange(1_000_000)}",
+            "location": f"{rng.choice(COUNTIES)}某某鄉{rng.randrange(100)}號",
+            "altitude": rng.choice([f"{rng.randrange(0, 3000)}m", "未知"]),
+            "pets": rng.choice(["自搭帳可帶寵物", "全區不可帶寵物", "可帶寵物，需繫繩"]),
+            "parking": rng.choice(["車停營位旁", "集中停車", "可下裝備後，集中停車"]),
+            "signal_strength": normalize_carriers(rng.sample(SIGNALS, rng.randrange(1, 4))),
+        }
+
+
+def _compile(condition):
+    """將 mongo_conditions 產生的條件轉為逐筆比對的函數（模擬資料庫的全表掃描）"""
+    if "$or" in condition:
+        checks = [_compile(sub) for sub in condition["$or"]]
+        return lambda doc: any(check(doc) for check in checks)
+    if len(condition) > 1:
+        checks = [_compile({field: expected}) for field, expected in condition.items()]
+        return lambda doc: all(check(doc) for check in checks)
+    (field, expected), = condition.items()
+    if isinstance(expected, dict) and "$in" in expected:
+        return lambda doc: doc.get(field) in expected["$in"]
+    if isinstance(expected, dict):
+        pattern = re.compile(expected["$regex"], re.IGNORECASE)
+        if expected.get("$type") == "string":
+            return lambda doc: isinstance(doc.get(field), str) and bool(pattern.search(doc[field]))
+        return lambda doc: bool(pattern.search(str(doc.get(field) or "")))
+    # 陣列欄位的等值條件為「包含此值」
+    return lambda doc: (
+        expected in doc[field] if isinstance(doc.get(field), list) else doc.get(field) == expected
+    )
+
+
+def regex_scan(campsites, filters):
+    checks = [_compile(condition) for condition in mongo_conditions(filters)]
+    results = [doc for doc in campsites if all(check(doc) for check in checks)]
+    if "altitude" in filters:
+        results = [doc for doc in results if altitude_band(doc.get("altitude")) == filters["altitude"]]
+    return [doc["_id"] for doc in results]
+
+
+def _timed(func, repeat: int = 5) -> float:
+    """回傳最佳一次的執行毫秒數"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_memory(sizes):
+    print(f"{'營地數':>8} {'查詢':<22} {'regex ms':>10} {'numpy ms':>10} {'倍數':>7} {'筆數':>7}")
+    for size in sizes:
+        campsites = list(synthetic_campsites(size))
+        start = time.perf_counter()
+        store = AttributeStore(campsites)
+        print(f"{size:>8} {'(建立欄位索引)':<22} {'':>10} {(time.perf_counter() - start) * 1000:>10.1f}")
+        for query in QUERIES:
+            filters, _ = parse_search_keywords(query.split())
+            expected = regex_scan(campsites, filters)
+            assert set(store.filter(**filters)) == set(expected), f"結果不一致: {query}"
+            regex_ms = _timed(lambda: regex_scan(campsites, filters))
+            numpy_ms = _timed(lambda: store.filter(**filters))
+            print(f"{size:>8} {query:<22} {regex_ms:>10.2f} {numpy_ms:>10.3f} "
+                  f"{regex_ms / numpy_ms:>6.0f}x {len(expected):>7}")
+
+
+def run_mongo(sizes):
+    from models import db
+
+    collection = db["benchmark_campsites"]
+    print(f"{'營地數':>8} {'查詢':<22} {'regex ms':>10} {'numpy+$in ms':>13}")
+    try:
+        for size in sizes:
+            collection.drop()
+            campsites = list(synthetic_campsites(size))
+            collection.insert_many(campsites)
+            store = AttributeStore(campsites)
+            for query in QUERIES:
+                filters, _ = parse_search_keywords(query.split())
+                regex_ms = _timed(
+                    lambda: list(collection.find({"$and": mongo_conditions(filters)})), repeat=3
+                )
+                numpy_ms = _timed(
+                    lambda: list(collection.find({"_id": {"$in": store.filter(**filters)}})), repeat=3
+                )
+                print(f"{size:>8} {query:<22} {regex_ms:>10.1f} {numpy_ms:>13.1f}")
+    finally:
+        collection.drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="結構化條件搜尋效能比較")
+    parser.add_argument("--mongo", action="store_true", help="同時比較實際的資料庫查詢")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    args = parser.parse_args()
+
+    run_memory(args.sizes)
+    if args.mongo:
+        run_mongo(args.sizes)
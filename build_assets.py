@@ -0,0 +1,176 @@
+"""
+靜態資源建置
+下載第三方 CSS/JS、壓縮圖片並產生 WebP、以內容雜湊命名檔案，
+並為文字檔預先產生 gzip / brotli 壓縮版本，結果寫入 static/dist/manifest.json
+
+使用方式:
+    python build_assets.py
+"""
+
+import os
+import io
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# 第三方資源（固定版本）
+VENDOR_FILES = {
+    "vendor/bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css",
+    "vendor/bootstrap.bundle.min.js": "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js",
+    "vendor/jquery.min.js": "https://code.jquery.com/jquery-3.6.0.min.js",
+    "vendor/fontawesome/css/all.min.css": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css",
+}
+FONTAWESOME_WEBFONTS = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/"
+FONTAWESOME_FONTS = [
+    f"{family}.{ext}"
+    for family in ("fa-brands-400", "fa-regular-400", "fa-solid-900", "fa-v4compatibility")
+    for ext in ("woff2", "ttf")
+]
+
+# 圖片在頁面上的最大顯示尺寸（已含高解析度螢幕的兩倍）
+IMAGE_MAX_SIZES = {
+    "logo.png": (400, 400),
+    "QRcode.png": (800, 800),
+    "Line-Icon.png": (96, 96),
+    "Camping-Icon.png": (192, 192),
+}
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".ttf")
+
+
+def _fingerprint(logical_name: str, data: bytes) -> str:
+    """在副檔名前加入內容雜湊"""
+    root, ext = os.path.splitext(logical_name)
+    if root.endswith(".min"):
+        root, ext = root[:-4], ".min" + ext
+    return f"dist/{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _write(relative_path: str, data: bytes):
+    path = os.path.join(STATIC_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(data, quality=11))
+
+
+def fetch_vendor_files():
+    """下載尚未存在的第三方資源到 static/vendor"""
+    files = dict(VENDOR_FILES)
+    for font in FONTAWESOME_FONTS:
+        files[f"vendor/fontawesome/webfonts/{font}"] = FONTAWESOME_WEBFONTS + font
+
+    for relative_path, url in files.items():
+        path = os.path.join(STATIC_DIR, relative_path)
+        if os.path.exists(path):
+            continue
+        logger.info(f"下載第三方資源: {url}")
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(response.content)
+
+
+def build_images(manifest):
+    """縮小並無損重新壓縮圖片，另外產生 WebP 版本"""
+    if Image is None:
+        logger.warning("未安裝 Pillow，圖片僅加上雜湊不做壓縮")
+
+    for name, max_size in IMAGE_MAX_SIZES.items():
+        with open(os.path.join(STATIC_DIR, name), "rb") as f:
+            original = f.read()
+        if Image is None:
+            manifest[name] = _fingerprint(name, original)
+            _write(manifest[name], original)
+            continue
+
+        image = Image.open(io.BytesIO(original))
+        image.thumbnail(max_size, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", optimize=True)
+        png = buffer.getvalue()
+        if len(png) >= len(original):
+            png = original
+        manifest[name] = _fingerprint(name, png)
+        _write(manifest[name], png)
+
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", lossless=True, method=6)
+        webp_name = os.path.splitext(name)[0] + ".webp"
+        manifest[webp_name] = _fingerprint(webp_name, buffer.getvalue())
+        _write(manifest[webp_name], buffer.getvalue())
+        logger.info(f"{name}: {len(original)} -> {len(png)} bytes (WebP {len(buffer.getvalue())})")
+
+
+def build_vendor(manifest):
+    """為第三方資源加上雜湊並預先壓縮"""
+    font_names = {}
+    for font in FONTAWESOME_FONTS:
+        logical = f"vendor/fontawesome/webfonts/{font}"
+        with open(os.path.join(STATIC_DIR, logical), "rb") as f:
+            data = f.read()
+        manifest[logical] = _fingerprint(logical, data)
+        font_names[font] = os.path.basename(manifest[logical])
+        _write(manifest[logical], data)
+
+    for logical in VENDOR_FILES:
+        with open(os.path.join(STATIC_DIR, logical), "rb") as f:
+            data = f.read()
+        if logical.endswith("all.min.css"):
+            # 字型改用加上雜湊的檔名
+            data = re.sub(
+                rb"\.\./webfonts/([\w.-]+)",
+                lambda m: b"../webfonts/" + font_names.get(m.group(1).decode(), m.group(1).decode()).encode(),
+                data,
+            )
+        manifest[logical] = _fingerprint(logical, data)
+        _write(manifest[logical], data)
+
+
+def build():
+    """重新建置 static/dist"""
+    fetch_vendor_files()
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {}
+    build_images(manifest)
+    build_vendor(manifest)
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        logger.warning("未安裝 brotli，只產生 gzip 壓縮檔")
+    return manifest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    result = build()
+    print(f"已建置 {len(result)} 個靜態資源")
@@ -42,16 +42,11 @@ class CacheManager:
     
     @staticmethod
     def warm_up_cache():
-        """預熱快取 - 預先載入常用資料"""
-        from models import Campsite
-        
-        # 預載入第一頁資料
-        Campsite.get_all_paginated(1, 12)
-        
-        # 預載入總數
-        Campsite.get_total_count()
-        
-        return "快取預熱完成"
+        """預熱快取 - 依熱門搜尋預先建立索引、搜尋結果與頁面快取"""
+        from cache_warmer import run_warmup
+
+        result = run_warmup()
+        return f"快取預熱完成（{result['done']} 項，{result['seconds']} 秒）"
 
 if __name__ == "__main__":
     # 測試快取管理功能
@@ -0,0 +1,161 @@
+"""
+背景快取預熱
+worker 啟動後與大量資料更新後，在背景依實際的熱門搜尋預先建立記憶體索引、
+搜尋結果與匿名頁面快取，不延遲 worker 開始接受請求。
+預熱在時間與記憶體預算用完時停止，剩下的交由一般請求在需要時建立
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("CACHE_WARMUP", "1") != "0"
+WARMUP_DELAY = float(os.getenv("CACHE_WARMUP_DELAY", 2))            # 開始前等待秒數
+WARMUP_TIME_BUDGET = float(os.getenv("CACHE_WARMUP_TIME_BUDGET", 30))  # 每次預熱最多執行秒數
+WARMUP_MAX_BYTES = int(os.getenv("CACHE_WARMUP_MAX_BYTES", 8 * 1024 * 1024))  # 頁面快取最多新增的位元組
+WARMUP_TOP_N = int(os.getenv("CACHE_WARMUP_TOP_N", 20))              # 預熱的熱門搜尋數
+WARMUP_PAUSE = 0.05  # 每項之間讓出執行緒，避免影響同時進來的請求
+WARMUP_SORTS = ("name", "location", "altitude")
+# 預熱請求的 WSGI environ 標記（不計入熱門搜尋統計）
+WARMUP_ENVIRON_KEY = "campingbot.cache_warmup"
+WARMUP_ACCEPT_ENCODING = "gzip, deflate, br"
+
+
+def _popular_cities(plans):
+    """熱門搜尋中出現的 LINE 搜尋流程縣市，依熱門程度排列"""
+    from geography import REGION_CITIES
+
+    cities = {city for values in REGION_CITIES.values() for city in values}
+    seen = []
+    for plan in plans:
+        for word in plan.split():
+            if word in cities and word not in seen:
+                seen.append(word)
+    return seen
+
+
+def warmup_tasks() -> Iterator[Tuple[str, Callable[[], None]]]:
+    """依重要性排列的預熱項目：(說明, 執行函數)"""
+    from models import Campsite
+    from facets import get_facet_index
+    from attribute_store import get_attribute_store
+    from suggest import get_suggest_trie
+    from query_normalizer import get_spelling_index
+    from search_telemetry import popular_searches
+
+    # 記憶體索引：篩選數量、結構化條件、輸入建議、拼字校正
+    yield "篩選索引", get_facet_index
+    yield "欄位索引", get_attribute_store
+    yield "搜尋建議", get_suggest_trie
+    yield "拼字校正", get_spelling_index
+
+    # 首頁各排序的第一頁
+    for sort in WARMUP_SORTS:
+        yield f"首頁 sort={sort}", lambda sort=sort: _get_page("/", {"sort": sort})
+
+    plans = popular_searches(WARMUP_TOP_N)
+    # LINE 搜尋流程：熱門縣市的搜尋結果與下一步選項數量
+    for city in _popular_cities(plans):
+        yield f"搜尋流程 {city}", lambda city=city: (
+            Campsite.search_by_keywords(city),
+            get_facet_index().counts((("city", city),)),
+        )
+    # 熱門搜尋的結果與搜尋頁
+    for plan in plans:
+        yield f"熱門搜尋 {plan}", lambda plan=plan: (
+            Campsite.search_by_keywords(plan),
+            _get_page("/", {"q": plan}),
+        )
+
+
+def _get_page(path, query):
+    """以應用程式內部請求產生匿名頁面，結果存入頁面快取"""
+    from app import app
+
+    with app.test_client() as client:
+        response = client.get(
+            path,
+            query_string=query,
+            headers={"Accept-Encoding": WARMUP_ACCEPT_ENCODING},
+            environ_overrides={WARMUP_ENVIRON_KEY: True},
+        )
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} {query} 回應 {response.status_code}")
+
+
+def _cached_bytes() -> int:
+    from page_cache import page_cache, fragment_cache
+
+    return page_cache.total_bytes + fragment_cache.total_bytes
+
+
+def run_warmup(time_budget: float = WARMUP_TIME_BUDGET, max_bytes: int = WARMUP_MAX_BYTES) -> dict:
+    """依序執行預熱項目直到完成或預算用完，回傳執行結果"""
+    started = time.monotonic()
+    start_bytes = _cached_bytes()
+    done, failed, stopped = 0, 0, None
+    for label, task in warmup_tasks():
+        if time.monotonic() - started >= time_budget:
+            stopped = "time"
+            break
+        if _cached_bytes() - start_bytes >= max_bytes:
+            stopped = "memory"
+            break
+        try:
+            task()
+            done += 1
+        except Exception as e:
+            failed += 1
+            logger.warning(f"預熱失敗（{label}）: {e}")
+        time.sleep(WARMUP_PAUSE)
+    result = {
+        "done": done,
+        "failed": failed,
+        "stopped": stopped,
+        "seconds": round(time.monotonic() - started, 2),
+        "bytes": _cached_bytes() - start_bytes,
+    }
+    logger.info(f"快取預熱完成: {result}")
+    return result
+
+
+_state = {"thread": None, "pending": False, "last": None}
+_state_lock = threading.Lock()
+
+
+def _worker(reason: str, delay: float):
+    time.sleep(delay)
+    while True:
+        logger.info(f"開始快取預熱（{reason}）")
+        try:
+            _state["last"] = run_warmup()
+        except Exception as e:
+            logger.error(f"快取預熱時發生錯誤: {e}")
+        with _state_lock:
+            # 預熱期間又有資料更新時再執行一次
+            if not _state["pending"]:
+                _state["thread"] = None
+                return
+            _state["pending"] = False
+            reason = "預熱期間資料已更新"
+
+
+def start_warmup(reason: str = "worker 啟動", delay: float = WARMUP_DELAY) -> bool:
+    """在背景執行預熱；已在執行時排定完成後再執行一次。回傳是否開始新的預熱"""
+    if not WARMUP_ENABLED:
+        return False
+    with _state_lock:
+        if _state["thread"] is not None:
+            _state["pending"] = True
+            return False
+        _state["thread"] = threading.Thread(target=_worker, args=(reason, delay), daemon=True)
+        _state["thread"].start()
+        return True
+
+
+def warmup_status() -> dict:
+    return {"running": _state["thread"] is not None, "last": _state["last"]}
@@ -0,0 +1,72 @@
+"""
+營地通訊資訊（signal_strength）的標準格式
+表單存的是勾選的電信業者清單，爬蟲存的是「中華電信有訊號, 遠傳有訊號」字串；
+兩者統一為電信業者代碼的陣列並建立 multikey 索引，篩選時以等值查詢
+
+使用方式（轉換既有資料）:
+    python carriers.py
+"""
+
+import re
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# 電信業者代碼（與 CampsiteForm 的選項相同），依顯示順序排列
+CARRIERS = ("中華電信", "遠傳", "台哥大", "亞太", "WIFI")
+NO_INFO = "無資訊"
+# 原始文字中的關鍵字 -> 代碼
+CARRIER_ALIASES = {
+    "中華": "中華電信",
+    "遠傳": "遠傳",
+    "台哥大": "台哥大",
+    "台灣大哥大": "台哥大",
+    "臺灣大哥大": "台哥大",
+    "亞太": "亞太",
+    "wifi": "WIFI",
+    "wi-fi": "WIFI",
+    "有網路": "WIFI",
+}
+SEPARATORS = re.compile(r"[,，、/]+")
+
+
+def normalize_carriers(value) -> List[str]:
+    """任何格式的通訊資訊轉為代碼陣列；沒有任何業者時為 ["無資訊"]"""
+    if isinstance(value, str):
+        parts = SEPARATORS.split(value)
+    elif isinstance(value, (list, tuple)):
+        parts = [str(item) for item in value]
+    else:
+        parts = []
+    found = set()
+    for part in parts:
+        text = part.strip().lower()
+        found.update(carrier for alias, carrier in CARRIER_ALIASES.items() if alias in text)
+    carriers = [carrier for carrier in CARRIERS if carrier in found]
+    return carriers or [NO_INFO]
+
+
+def backfill_carriers(batch_size: int = 500) -> int:
+    """將所有營地的 signal_strength 轉為代碼陣列，回傳更新筆數"""
+    from pymongo import UpdateOne
+    from models import collection
+
+    updated = 0
+    batch = []
+    for campsite in collection.find({}, {"signal_strength": 1}):
+        carriers = normalize_carriers(campsite.get("signal_strength"))
+        if campsite.get("signal_strength") != carriers:
+            batch.append(UpdateOne({"_id": campsite["_id"]}, {"$set": {"signal_strength": carriers}}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    logger.info(f"已轉換 {updated} 個營地的通訊資訊")
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("已轉換營地數:", backfill_carriers())
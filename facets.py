@@ -0,0 +1,147 @@
+"""
+篩選條件計數
+為每個篩選選項預先建立營地位元集合（以 Python 整數表示），
+計算目前條件下各選項的營地數只需要位元 AND 與 popcount，
+分類規則與 Campsite.search_by_keywords 一致
+"""
+
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from carriers import CARRIERS, normalize_carriers
+from geography import CITY_COUNTIES, classify_location
+from search_filters import altitude_band, field_text, parking_matches, pet_options
+
+logger = logging.getLogger(__name__)
+
+# 關鍵字搜尋比對的欄位
+KEYWORD_FIELDS = ("name", "location", "features", "altitude", "WC", "facilities", "sideservice")
+FACET_PROJECTION = {
+    field: 1 for field in KEYWORD_FIELDS + ("pets", "parking", "signal_strength", "description")
+}
+FACETS = ("region", "city", "county", "altitude", "pets", "parking", "carrier")
+
+
+def _popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+def classify(campsite: Dict[str, Any]) -> Dict[str, List[str]]:
+    """回傳營地在各篩選項目中符合的選項（規則取自 search_filters）"""
+    place = classify_location(field_text(campsite.get("location")))
+    band = altitude_band(campsite.get("altitude"))
+    return {
+        "region": [place["region"]] if place["region"] else [],
+        "city": [city for city, counties in CITY_COUNTIES.items() if place["county"] in counties],
+        "county": [place["county"]] if place["county"] else [],
+        "altitude": [band] if band else [],
+        "pets": pet_options(campsite),
+        "parking": list(dict.fromkeys(parking_type for parking_type, _ in parking_matches(campsite))),
+        "carrier": [
+            carrier for carrier in normalize_carriers(campsite.get("signal_strength")) if carrier in CARRIERS
+        ],
+    }
+
+
+def _bitset(positions: Iterable[int], size: int) -> int:
+    bitmap = bytearray((size + 7) // 8)
+    for position in positions:
+        bitmap[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bitmap, "little")
+
+
+class FacetIndex:
+    """各篩選選項的營地位元集合"""
+
+    def __init__(self, campsites: List[Dict[str, Any]]):
+        self.size = len(campsites)
+        self.all = (1 << self.size) - 1
+        self.positions = {campsite["_id"]: i for i, campsite in enumerate(campsites)}
+
+        members = {facet: {} for facet in FACETS}
+        for i, campsite in enumerate(campsites):
+            for facet, values in classify(campsite).items():
+                for value in values:
+                    members[facet].setdefault(value, []).append(i)
+        self.bitsets = {
+            facet: {value: _bitset(positions, self.size) for value, positions in values.items()}
+            for facet, values in members.items()
+        }
+        self.counts = lru_cache(maxsize=1024)(self._counts)
+
+    def mask_for_ids(self, ids: Iterable[Any]) -> int:
+        """將搜尋結果的營地 _id 轉為位元集合"""
+        return _bitset((self.positions[i] for i in ids if i in self.positions), self.size)
+
+    def _counts(self, filters: Tuple[Tuple[str, str], ...] = (), base: Optional[int] = None):
+        """計算各選項在其他已選條件下的營地數
+
+        filters 為 ((項目, 選項), ...)；每個項目的計數不套用自身的條件，
+        使用者可以看到改選同一項目其他選項時的結果數。
+        """
+        base = self.all if base is None else base
+        selected = {
+            facet: self.bitsets.get(facet, {}).get(value, 0) for facet, value in filters if value
+        }
+        result = {}
+        for facet, values in self.bitsets.items():
+            mask = base
+            for other, bits in selected.items():
+                if other != facet:
+                    mask &= bits
+            result[facet] = {value: _popcount(bits & mask) for value, bits in values.items()}
+
+        total = base
+        for bits in selected.values():
+            total &= bits
+        result["total"] = _popcount(total)
+        return result
+
+
+_index = {"version": None, "value": None}
+_index_lock = threading.Lock()
+
+
+def get_facet_index() -> FacetIndex:
+    """取得目前資料版本的篩選索引，資料變更後重建"""
+    from models import Campsite, get_data_version
+
+    version = get_data_version()
+    if _index["version"] != version:
+        with _index_lock:
+            if _index["version"] != version:
+                _index["value"] = FacetIndex(Campsite.get_facet_fields())
+                _index["version"] = version
+                logger.info(f"篩選索引已重建: {_index['value'].size} 個營地")
+    return _index["value"]
+
+
+def visible_option_groups(groups: Dict[str, List[str]], counts: Optional[Dict[str, int]],
+                          selected: str) -> List[Tuple[str, List[Tuple[str, Optional[int]]]]]:
+    """篩選選單的分組選項 [(分組, [(選項, 營地數)])]，隱藏計數為 0 的選項與空分組"""
+    result = []
+    for group, options in groups.items():
+        visible = [
+            (option, counts.get(option, 0) if counts is not None else None)
+            for option in options
+            if counts is None or counts.get(option, 0) or option == selected
+        ]
+        if visible:
+            result.append((group, visible))
+    return result
+
+
+def web_facet_counts(q: str, county: str, pets: str) -> Optional[Dict[str, Dict[str, int]]]:
+    """首頁篩選選單的計數，關鍵字先以搜尋結果縮小範圍；失敗時回傳 None"""
+    try:
+        index = get_facet_index()
+        base = None
+        if q:
+            from models import Campsite
+            base = index.mask_for_ids(c["_id"] for c in Campsite.search_by_keywords(q))
+        return index.counts((("county", county), ("pets", pets)), base)
+    except Exception as e:
+        logger.warning(f"計算篩選計數失敗: {e}")
+        return None
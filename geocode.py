@@ -0,0 +1,165 @@
+"""
+營地座標（離線地理編碼）
+以專案內附的縣市與鄉鎮中心點表，從營地地址推得近似座標，存為 GeoJSON 的 geo 欄位，
+搭配 2dsphere 索引以 $geoNear 依距離查詢最近的營地。
+座標為鄉鎮（找不到鄉鎮時為縣市）的中心點，適合「附近的營地」排序，不適合導航
+
+使用方式（為既有資料補上座標）:
+    python geocode.py
+"""
+
+import math
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from geography import find_county
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6378100  # MongoDB 球面查詢使用的地球半徑
+
+# 縣市中心點 (緯度, 經度)
+COUNTY_CENTROIDS = {
+    "台北市": (25.05, 121.55),
+    "新北市": (24.99, 121.60),
+    "基隆市": (25.13, 121.74),
+    "桃園市": (24.93, 121.25),
+    "新竹市": (24.80, 120.97),
+    "新竹縣": (24.70, 121.15),
+    "宜蘭縣": (24.61, 121.63),
+    "苗栗縣": (24.49, 120.94),
+    "台中市": (24.23, 120.94),
+    "彰化縣": (23.99, 120.48),
+    "南投縣": (23.83, 120.98),
+    "雲林縣": (23.71, 120.38),
+    "嘉義市": (23.48, 120.45),
+    "嘉義縣": (23.46, 120.57),
+    "台南市": (23.15, 120.26),
+    "高雄市": (22.99, 120.55),
+    "屏東縣": (22.55, 120.62),
+    "花蓮縣": (23.75, 121.35),
+    "台東縣": (22.98, 121.05),
+    "澎湖縣": (23.57, 119.58),
+    "金門縣": (24.44, 118.32),
+    "連江縣": (26.16, 119.95),
+}
+
+# 營地較多的鄉鎮中心點 (緯度, 經度)，依縣市分組；未列出的鄉鎮使用縣市中心點
+TOWNSHIP_CENTROIDS = {
+    "新北市": {
+        "烏來區": (24.80, 121.55), "坪林區": (24.94, 121.71), "石碇區": (24.99, 121.66),
+        "三峽區": (24.93, 121.37), "平溪區": (25.03, 121.74), "雙溪區": (25.00, 121.83),
+        "新店區": (24.93, 121.53), "萬里區": (25.18, 121.66), "石門區": (25.27, 121.56),
+    },
+    "桃園市": {
+        "復興區": (24.75, 121.38), "大溪區": (24.88, 121.29), "龍潭區": (24.85, 121.21),
+    },
+    "新竹縣": {
+        "尖石鄉": (24.62, 121.24), "五峰鄉": (24.60, 121.11), "關西鎮": (24.79, 121.18),
+        "橫山鄉": (24.72, 121.13), "竹東鎮": (24.74, 121.09), "北埔鄉": (24.70, 121.06),
+        "峨眉鄉": (24.68, 121.02),
+    },
+    "苗栗縣": {
+        "泰安鄉": (24.42, 121.00), "南庄鄉": (24.60, 121.00), "大湖鄉": (24.42, 120.86),
+        "獅潭鄉": (24.54, 120.92), "三義鄉": (24.41, 120.76), "卓蘭鎮": (24.31, 120.83),
+    },
+    "台中市": {
+        "和平區": (24.30, 121.10), "東勢區": (24.26, 120.83), "新社區": (24.20, 120.82),
+        "太平區": (24.12, 120.78), "石岡區": (24.27, 120.78),
+    },
+    "南投縣": {
+        "仁愛鄉": (24.03, 121.13), "信義鄉": (23.68, 121.00), "埔里鎮": (23.97, 120.97),
+        "魚池鄉": (23.88, 120.93), "國姓鄉": (24.03, 120.86), "鹿谷鄉": (23.74, 120.75),
+        "竹山鎮": (23.69, 120.70), "水里鄉": (23.81, 120.85),
+    },
+    "宜蘭縣": {
+        "大同鄉": (24.55, 121.50), "南澳鄉": (24.45, 121.70), "冬山鄉": (24.63, 121.75),
+        "員山鄉": (24.74, 121.68), "礁溪鄉": (24.82, 121.75), "三星鄉": (24.67, 121.65),
+    },
+    "雲林縣": {"古坑鄉": (23.63, 120.60)},
+    "嘉義縣": {
+        "阿里山鄉": (23.43, 120.75), "番路鄉": (23.43, 120.58), "梅山鄉": (23.58, 120.62),
+        "竹崎鄉": (23.52, 120.55), "中埔鄉": (23.42, 120.52),
+    },
+    "台南市": {"楠西區": (23.17, 120.48), "東山區": (23.28, 120.44), "白河區": (23.35, 120.42)},
+    "高雄市": {
+        "桃源區": (23.20, 120.87), "茂林區": (22.90, 120.70), "六龜區": (23.00, 120.63),
+        "甲仙區": (23.08, 120.59), "那瑪夏區": (23.27, 120.72),
+    },
+    "屏東縣": {
+        "霧台鄉": (22.74, 120.74), "三地門鄉": (22.72, 120.66), "春日鄉": (22.37, 120.68),
+        "牡丹鄉": (22.15, 120.79), "恆春鎮": (21.98, 120.75), "滿州鄉": (22.02, 120.84),
+    },
+    "花蓮縣": {
+        "秀林鄉": (24.15, 121.50), "壽豐鄉": (23.85, 121.55), "瑞穗鄉": (23.50, 121.37),
+        "玉里鎮": (23.34, 121.31), "富里鄉": (23.18, 121.25), "光復鄉": (23.66, 121.43),
+    },
+    "台東縣": {
+        "池上鄉": (23.10, 121.22), "鹿野鄉": (22.92, 121.13), "卑南鄉": (22.78, 121.07),
+        "東河鄉": (22.97, 121.30), "太麻里鄉": (22.61, 120.99), "長濱鄉": (23.32, 121.45),
+    },
+}
+
+
+def geocode(location: str) -> Optional[Tuple[float, float, str]]:
+    """地址的近似座標：(緯度, 經度, 精確度 township/county)，無法判斷縣市時回傳 None"""
+    found = find_county(location)
+    if found is None:
+        return None
+    county, rest = found
+    # 只比對縣市名稱之後的部分，避免縣市名稱本身被誤認為鄉鎮
+    for township, (lat, lng) in TOWNSHIP_CENTROIDS.get(county, {}).items():
+        if township in rest:
+            return lat, lng, "township"
+    lat, lng = COUNTY_CENTROIDS[county]
+    return lat, lng, "county"
+
+
+def geo_fields(campsite: Dict[str, Any]) -> Dict[str, Any]:
+    """寫入營地的座標欄位（GeoJSON Point，座標順序為經度、緯度）"""
+    result = geocode(str(campsite.get("location") or ""))
+    if result is None:
+        return {"geo": None, "geo_precision": None}
+    lat, lng, precision = result
+    return {"geo": {"type": "Point", "coordinates": [lng, lat]}, "geo_precision": precision}
+
+
+def distance_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """兩點間的球面距離（公尺），與 $geoNear 的 distance 一致"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(h))
+
+
+def parse_coordinates(lat, lng) -> Optional[Tuple[float, float]]:
+    """驗證並轉換使用者提供的緯度、經度，無效時回傳 None"""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def backfill_geo(batch_size: int = 500) -> int:
+    """重新計算所有營地的座標，回傳更新筆數"""
+    from pymongo import UpdateOne
+    from models import collection
+
+    updated = 0
+    batch = []
+    for campsite in collection.find({}, {"location": 1}):
+        batch.append(UpdateOne({"_id": campsite["_id"]}, {"$set": geo_fields(campsite)}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    logger.info(f"已更新 {updated} 個營地的座標")
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("已更新營地數:", backfill_geo())
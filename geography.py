@@ -0,0 +1,108 @@
+"""
+台灣地理分區
+網頁篩選的縣市分組與 LINE 搜尋流程的區域、縣市對照，
+以及營地地址的縣市、區域解析（寫入時解析一次，存為有索引的 county、region 欄位）
+
+使用方式（為既有資料補上縣市與區域）:
+    python geography.py
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 網頁篩選選單的縣市分組
+COUNTY_GROUPS = {
+    "北部地區": ["台北市", "新北市", "基隆市", "桃園市", "新竹市", "新竹縣", "宜蘭縣"],
+    "中部地區": ["苗栗縣", "台中市", "彰化縣", "南投縣", "雲林縣"],
+    "南部地區": ["嘉義市", "嘉義縣", "台南市", "高雄市", "屏東縣"],
+    "東部地區": ["花蓮縣", "台東縣"],
+    "離島地區": ["澎湖縣", "金門縣", "連江縣"],
+}
+COUNTIES = [county for counties in COUNTY_GROUPS.values() for county in counties]
+
+# LINE 搜尋流程的區域與縣市（與關鍵字搜尋的區域定義一致）
+REGION_CITIES = {
+    "北部": ["台北", "新北", "基隆", "新竹", "桃園", "宜蘭"],
+    "中部": ["台中", "苗栗", "彰化", "南投", "雲林"],
+    "南部": ["高雄", "台南", "嘉義", "屏東", "澎湖"],
+    "東部": ["花蓮", "台東"],
+}
+
+
+def city_variants(city: str):
+    """縣市名稱的「台／臺」兩種寫法"""
+    if city.startswith("台"):
+        return [city, "臺" + city[1:]]
+    return [city]
+
+
+def _region_of(county: str):
+    for region, cities in REGION_CITIES.items():
+        if any(county.startswith(city) for city in cities):
+            return region
+    return None
+
+
+# 縣市所屬的區域（離島中的金門、連江不屬於任何區域）
+COUNTY_REGION = {county: _region_of(county) for county in COUNTIES}
+# LINE 搜尋流程的縣市（如「新竹」）包含的縣市
+CITY_COUNTIES = {
+    city: [county for county in COUNTIES if county.startswith(city)]
+    for cities in REGION_CITIES.values()
+    for city in cities
+}
+
+
+def find_county(location: str):
+    """地址中的縣市：(縣市名稱（統一為「台」的寫法）, 縣市之後的地址)，找不到時回傳 None"""
+    if not location:
+        return None
+    # 取地址中最早出現的縣市，避免「（近台北市）」等附註覆蓋實際的縣市
+    best = None
+    for county in COUNTIES:
+        for variant in city_variants(county):
+            position = location.find(variant)
+            if position >= 0 and (best is None or position < best[0]):
+                best = (position, county, variant)
+    if best is None:
+        return None
+    position, county, variant = best
+    return county, location[position + len(variant):]
+
+
+def classify_location(location) -> dict:
+    """由地址解析出縣市與區域，寫入營地的 county、region 欄位（無法判斷時為 None）"""
+    found = find_county(str(location or ""))
+    county = found[0] if found else None
+    return {"county": county, "region": COUNTY_REGION.get(county)}
+
+
+def county_members(keyword: str):
+    """縣市或 LINE 搜尋流程縣市關鍵字涵蓋的縣市"""
+    return CITY_COUNTIES.get(keyword) or [keyword]
+
+
+def backfill_locations(batch_size: int = 500) -> int:
+    """重新解析所有營地地址的縣市與區域，回傳更新筆數"""
+    from pymongo import UpdateOne
+    from models import collection
+
+    updated = 0
+    batch = []
+    for campsite in collection.find({}, {"location": 1}):
+        batch.append(UpdateOne(
+            {"_id": campsite["_id"]}, {"$set": classify_location(campsite.get("location"))}
+        ))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    logger.info(f"已更新 {updated} 個營地的縣市與區域")
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("已更新營地數:", backfill_locations())
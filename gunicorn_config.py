@@ -39,6 +39,19 @@ graceful_timeout = 30
 # 不預加載應用以節省內存
 preload_app = False
 
+
+def post_worker_init(worker):
+    """worker 載入應用後驗證 LINE 選單模板、確認資料庫結構版本，並在背景預熱快取
+
+    模板格式錯誤時讓 worker 啟動失敗，不等到使用者點選才發現
+    """
+    from line_bot import validate_templates
+    from migrations import check_schema
+    from cache_warmer import start_warmup
+    validate_templates()
+    check_schema()
+    start_warmup()
+
 # 限制緩衝區大小
 limit_request_line = 4096
 limit_request_fields = 100
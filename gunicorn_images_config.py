@@ -0,0 +1,36 @@
+# 圖片服務（image_service）專用設定，與網頁 / webhook 進程分開
+# 啟動方式: gunicorn -c gunicorn_images_config.py "image_service:create_app()"
+import os
+
+# 綁定的 IP 和端口
+bind = f"0.0.0.0:{os.getenv('IMAGE_PORT', '13216')}"
+
+# 圖片請求大多在等待網路 I/O，使用較多執行緒
+workers = 1
+worker_class = "gthread"
+threads = 8
+
+# 每個執行緒都可以向來源抓圖
+raw_env = [f"IMAGE_PROXY_CONCURRENCY={os.getenv('IMAGE_PROXY_CONCURRENCY', '8')}"]
+
+# 圖片下載較慢，但不要無限等待
+timeout = 30
+graceful_timeout = 30
+
+# 不使用守護進程
+daemon = False
+
+# 日誌
+loglevel = "info"
+accesslog = "-"
+errorlog = "-"
+
+# 進程名稱
+proc_name = "camping-bot-images"
+
+max_requests = 2000
+max_requests_jitter = 200
+
+keepalive = 5
+worker_tmp_dir = "/dev/shm"
+forwarded_allow_ips = "*"
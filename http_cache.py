@@ -0,0 +1,139 @@
+"""
+HTTP 回應壓縮與條件式請求
+超過門檻的文字回應以 brotli / gzip 壓縮；匿名訪客的列表頁依資料版本
+產生弱 ETag，內容未變時直接回應 304，不查詢資料庫也不渲染樣板
+"""
+
+import os
+import gzip
+import hashlib
+import logging
+from functools import wraps
+
+from flask import Response, current_app, request, session
+from flask_login import current_user
+
+from models import get_data_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_MIMETYPES = {
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/xml",
+    "application/xml",
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+}
+# 動態內容使用較低的壓縮等級，避免壓縮時間抵銷傳輸節省
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+
+def init_http_cache(app):
+    """註冊回應壓縮並計算樣板版本"""
+    app.extensions["render_version"] = _render_version(app)
+    app.after_request(compress_response)
+
+
+def _render_version(app) -> str:
+    """樣板與靜態資源 manifest 的雜湊，部署新版後舊的 ETag 自然失效"""
+    digest = hashlib.sha256()
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for root, _, files in sorted(os.walk(template_dir)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(name.encode("utf-8"))
+                digest.update(f.read())
+    digest.update(repr(sorted(app.extensions.get("asset_manifest", {}).items())).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def negotiate_encoding():
+    """依 Accept-Encoding 選擇壓縮格式，不支援時回傳 None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def encode_body(data: bytes, encoding):
+    """壓縮回應內容，內容太小時不壓縮；回傳 (內容, 實際使用的格式)"""
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return data, None
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY), encoding
+    return gzip.compress(data, compresslevel=GZIP_LEVEL), encoding
+
+
+def compress_response(response):
+    """依 Accept-Encoding 壓縮足夠大的文字回應"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESS_MIMETYPES
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body, encoding = encode_body(data, negotiate_encoding())
+    if encoding:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def is_anonymous_request() -> bool:
+    """未登入且沒有待顯示的提示訊息，頁面內容只由網址與資料版本決定"""
+    return not current_user.is_authenticated and "_flashes" not in session
+
+
+def render_version() -> str:
+    return current_app.extensions["render_version"]
+
+
+def page_etag() -> str:
+    return f"{render_version()}-{get_data_version()}"
+
+
+def _set_page_cache_headers(response, etag: str):
+    response.set_etag(etag, weak=True)
+    # 每次都向伺服器確認，登入後的頁面內容不同，因此依 Cookie 區分
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+
+
+def conditional_page(view):
+    """匿名訪客的頁面支援 If-None-Match，內容未變時回應 304"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or not is_anonymous_request():
+            return view(*args, **kwargs)
+
+        etag = page_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        _set_page_cache_headers(response, etag)
+        return response
+    return wrapper
@@ -0,0 +1,259 @@
+"""
+圖片代理快取
+以串流方式轉送遠端圖片，並將結果存入以位元組為上限的磁碟 LRU 快取
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import requests
+from flask import Response, send_file
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "camping-image-cache")
+)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 10 * 1024 * 1024))  # 與爬蟲的圖片上限一致
+IMAGE_FRESH_SECONDS = int(os.getenv("IMAGE_FRESH_SECONDS", 24 * 3600))  # 超過後向來源重新驗證
+IMAGE_UPSTREAM_TIMEOUT = (3.05, 10)  # (連線, 讀取) 秒
+# 同時向來源抓圖的上限，避免圖片請求占滿處理頁面與 webhook 的執行緒
+# （預設值用於掛在網頁 worker 上的情況，須小於 gunicorn_config.py 的 threads；
+# 獨立的圖片服務由 gunicorn_images_config.py 設定）
+IMAGE_PROXY_CONCURRENCY = int(os.getenv("IMAGE_PROXY_CONCURRENCY", 1))
+IMAGE_PROXY_WAIT = float(os.getenv("IMAGE_PROXY_WAIT", 3))  # 獨立圖片服務名額已滿時最多等待秒數
+# 等不到名額時改為轉址到來源（可能遇到防盜連或 http 混合內容），預設回應 503
+IMAGE_PROXY_REDIRECT_FALLBACK = os.getenv("IMAGE_PROXY_REDIRECT_FALLBACK", "0") == "1"
+CHUNK_SIZE = 64 * 1024
+
+
+class DiskImageCache:
+    """以 URL 為鍵的磁碟 LRU 快取
+
+    每張圖片存成 <key>.bin，中繼資料（Content-Type、ETag 等）存成
+    <key>.json。索引保存在記憶體中，啟動時由中繼資料檔重建。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._index = OrderedDict()  # key -> meta
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self):
+        """從磁碟重建索引，依最後使用時間排序"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            try:
+                with open(self._meta_path(key), encoding="utf-8") as f:
+                    meta = json.load(f)
+                if os.path.exists(self.path_for(key)):
+                    entries.append((meta.get("fetched_at", 0), key, meta))
+            except (OSError, ValueError):
+                continue
+        for _, key, meta in sorted(entries):
+            self._index[key] = meta
+            self.total_bytes += meta.get("size", 0)
+        self._evict()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """取得快取項目的中繼資料，並標記為最近使用"""
+        key = self.key_for(url)
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return None
+            if not os.path.exists(self.path_for(key)):
+                # 檔案可能已被其他 worker 淘汰
+                self._index.pop(key, None)
+                self.total_bytes -= meta.get("size", 0)
+                return None
+            self._index.move_to_end(key)
+            return dict(meta, key=key)
+
+    def mark_fresh(self, url: str):
+        """來源回應 304 後更新驗證時間"""
+        key = self.key_for(url)
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return
+            meta["fetched_at"] = time.time()
+            self._write_meta(key, meta)
+
+    def store(self, url: str, temp_path: str, meta: Dict[str, Any]):
+        """將下載完成的暫存檔納入快取"""
+        key = self.key_for(url)
+        meta = dict(meta, url=url, fetched_at=time.time())
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old:
+                self.total_bytes -= old.get("size", 0)
+            os.replace(temp_path, self.path_for(key))
+            self._write_meta(key, meta)
+            self._index[key] = meta
+            self.total_bytes += meta["size"]
+            self._evict()
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]):
+        with open(self._meta_path(key), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _evict(self):
+        """淘汰最久未使用的項目直到低於容量上限"""
+        while self.total_bytes > self.max_bytes and self._index:
+            key, meta = self._index.popitem(last=False)
+            self.total_bytes -= meta.get("size", 0)
+            for path in (self.path_for(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+image_cache = DiskImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+_session = requests.Session()
+_session.headers.update({"User-Agent": "Mozilla/5.0"})
+# 圖片專用的來源連線池
+_adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=IMAGE_PROXY_CONCURRENCY * 2)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+
+def _cached_response(meta: Dict[str, Any]):
+    """回傳快取中的圖片，由 Werkzeug 處理 If-None-Match / If-Modified-Since"""
+    response = send_file(
+        image_cache.path_for(meta["key"]),
+        mimetype=meta["content_type"],
+        etag=meta["etag"],
+        last_modified=meta["fetched_at"],
+        max_age=IMAGE_FRESH_SECONDS,
+        conditional=True,
+    )
+    response.cache_control.public = True
+    return response
+
+
+def fresh_image_response(url: str):
+    """快取中尚未過期的圖片，沒有或已過期時回傳 None（不需向來源連線）"""
+    meta = image_cache.get(url)
+    if meta and time.time() - meta["fetched_at"] < IMAGE_FRESH_SECONDS:
+        return _cached_response(meta)
+    return None
+
+
+def cached_image_response(url: str):
+    """只從快取回應（不論是否過期），沒有快取時回傳 None"""
+    meta = image_cache.get(url)
+    return _cached_response(meta) if meta else None
+
+
+def _stream_and_store(url: str, upstream, meta: Dict[str, Any]):
+    """邊轉送邊寫入暫存檔，完整下載且未超過上限才納入快取"""
+    fd, temp_path = tempfile.mkstemp(dir=image_cache.directory, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    complete = False
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in upstream.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    logger.warning(f"圖片超過大小上限，停止轉送: {url}")
+                    return
+                digest.update(chunk)
+                f.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        upstream.close()
+        if complete:
+            image_cache.store(url, temp_path, dict(meta, size=size, etag=digest.hexdigest()))
+        else:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def proxy_image(url: str):
+    """代理遠端圖片：新鮮的快取直接回應，過期的以條件請求向來源重新驗證"""
+    response = fresh_image_response(url)
+    if response is not None:
+        return response
+    meta = image_cache.get(url)
+
+    headers = {}
+    if meta:
+        if meta.get("upstream_etag"):
+            headers["If-None-Match"] = meta["upstream_etag"]
+        if meta.get("upstream_last_modified"):
+            headers["If-Modified-Since"] = meta["upstream_last_modified"]
+
+    try:
+        upstream = _session.get(url, headers=headers, stream=True, timeout=IMAGE_UPSTREAM_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"圖片來源無法連線: {url}, 錯誤: {e}")
+        if meta:
+            return _cached_response(meta)  # 來源失效時使用舊的快取
+        return "圖片無法載入", 502
+
+    if upstream.status_code == 304 and meta:
+        upstream.close()
+        image_cache.mark_fresh(url)
+        return _cached_response(image_cache.get(url) or meta)
+
+    content_type = upstream.headers.get("Content-Type", "")
+    if upstream.status_code != 200 or not content_type.startswith("image/"):
+        upstream.close()
+        if meta:
+            return _cached_response(meta)
+        return "圖片無法載入", upstream.status_code if upstream.status_code != 200 else 502
+
+    content_length = int(upstream.headers.get("Content-Length") or 0)
+    if content_length > IMAGE_MAX_BYTES:
+        upstream.close()
+        return "圖片過大", 502
+
+    new_meta = {
+        "content_type": content_type,
+        "upstream_etag": upstream.headers.get("ETag"),
+        "upstream_last_modified": upstream.headers.get("Last-Modified"),
+    }
+    response = Response(_stream_and_store(url, upstream, new_meta), content_type=content_type)
+    if content_length and not upstream.headers.get("Content-Encoding"):
+        response.content_length = content_length
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_FRESH_SECONDS
+    return response
@@ -0,0 +1,101 @@
+"""
+圖片服務
+圖片代理與縮圖路由，可掛在主程式上，也可用獨立的 gunicorn 進程執行：
+
+    gunicorn -c gunicorn_images_config.py "image_service:create_app()"
+
+掛在主程式上時，向來源抓圖的名額用完就立即回應 503，不占住頁面與 webhook 的執行緒；
+獨立執行時需設定 IMAGE_BASE_URL 並將該網域導向圖片服務，頁面的圖片網址才會指向它
+"""
+
+import threading
+from urllib.parse import quote
+
+from flask import Blueprint, Flask, abort, current_app, make_response, redirect, request, send_file
+
+from image_cache import (
+    IMAGE_PROXY_CONCURRENCY,
+    IMAGE_PROXY_REDIRECT_FALLBACK,
+    IMAGE_PROXY_WAIT,
+    cached_image_response,
+    fresh_image_response,
+    proxy_image,
+)
+from thumbnails import IMAGE_BASE_URL, THUMBNAIL_NAME_RE, thumbnail_path
+
+image_bp = Blueprint("images", __name__)
+
+# 向來源抓圖的名額
+_proxy_slots = threading.BoundedSemaphore(IMAGE_PROXY_CONCURRENCY)
+
+
+def proxied_image_url(url: str) -> str:
+    """原圖經由圖片代理的網址"""
+    return f"{IMAGE_BASE_URL}/image_proxy?url={quote(url, safe='')}"
+
+
+@image_bp.route("/image_proxy")
+def image_proxy():
+    image_url = request.args.get("url")
+    if not image_url:
+        return "缺少圖片 URL", 400
+    if not image_url.startswith(("http://", "https://")):
+        return "無效的圖片 URL", 400
+
+    # 未過期的快取不需要名額
+    response = fresh_image_response(image_url)
+    if response is not None:
+        return response
+
+    # 獨立的圖片服務可短暫排隊；掛在主程式上時不等待，避免占住頁面與 webhook 的執行緒
+    if current_app.config.get("IMAGE_SERVICE_STANDALONE"):
+        acquired = _proxy_slots.acquire(timeout=IMAGE_PROXY_WAIT)
+    else:
+        acquired = _proxy_slots.acquire(blocking=False)
+    if not acquired:
+        # 名額已滿：有過期的快取就直接回應，否則請瀏覽器稍後再試
+        response = cached_image_response(image_url)
+        if response is not None:
+            return response
+        if IMAGE_PROXY_REDIRECT_FALLBACK:
+            return redirect(image_url)
+        return "圖片代理忙碌中", 503, {"Retry-After": "1", "Cache-Control": "no-store"}
+
+    try:
+        response = make_response(proxy_image(image_url))
+    except Exception:
+        _proxy_slots.release()
+        raise
+    # 串流回應傳送完畢後才釋放名額
+    response.call_on_close(_proxy_slots.release)
+    return response
+
+
+@image_bp.route("/thumbs/<name>")
+def thumbnail(name):
+    # 檔名即內容雜湊，內容永不改變
+    if not THUMBNAIL_NAME_RE.match(name):
+        abort(404)
+    try:
+        response = send_file(thumbnail_path(name), max_age=365 * 24 * 3600)
+    except FileNotFoundError:
+        abort(404)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def create_app():
+    """只提供圖片路由的輕量應用程式"""
+    if not IMAGE_BASE_URL:
+        # 沒有 IMAGE_BASE_URL 時頁面的圖片網址指向主程式，這個服務不會收到任何請求
+        raise RuntimeError("獨立的圖片服務需要設定 IMAGE_BASE_URL（導向此服務的網址）")
+    app = Flask(__name__)
+    app.config["IMAGE_SERVICE_STANDALONE"] = True
+    app.register_blueprint(image_bp)
+
+    @app.route("/health")
+    def health_check():
+        return {"status": "healthy"}, 200
+
+    return app
@@ -0,0 +1,236 @@
+"""
+資料庫索引檢查
+以實際的查詢形式（首頁、營地頁、sitemap、附近的營地與熱門搜尋）逐一執行 explain()，
+列出每個查詢使用的索引或全表掃描、檢查的文件數與回傳數，
+並與 models.CAMPSITE_INDEXES 比較，列出缺少與沒有查詢使用的索引
+
+使用方式:
+    python index_audit.py                # 只列出報告
+    python index_audit.py --apply        # 建立缺少的索引
+    python index_audit.py --apply --drop # 另外刪除不在設定中的索引
+"""
+
+import logging
+import argparse
+from typing import Any, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 代表性的搜尋（另外加上熱門搜尋統計中的前幾名）
+AUDIT_QUERIES = (
+    "北部",
+    "新竹",
+    "台中 高海拔",
+    "北部 可帶寵物 中華",
+    "南部 集中停車 遠傳",
+    "宜蘭 wifi",
+    "溪邊",
+    "森林 親子",
+)
+AUDIT_TOP_N = 10
+AUDIT_POINT = (24.23, 120.94)  # 附近的營地查詢使用的座標（台中市）
+EXAMINED_RATIO_WARNING = 10    # 檢查文件數超過回傳數的倍數時標示
+ID_STAGES = {"IDHACK", "EXPRESS_IXSCAN", "EXPRESS_CLUSTERED_IXSCAN"}
+
+Query = Tuple[str, str, Dict[str, Any]]  # (說明, find/aggregate, 參數)
+
+
+def query_corpus(top_n: int = AUDIT_TOP_N) -> Iterator[Query]:
+    """依 models 的查詢方法產生要檢查的查詢"""
+    from models import CAMPSITE_PROJECTION, Campsite, collection
+    from query_normalizer import parse_query, plan_key
+    from search_telemetry import popular_searches
+
+    yield "全部營地", "find", {"filter": {}, "projection": CAMPSITE_PROJECTION}
+    yield "首頁分頁", "find", {"filter": {}, "projection": CAMPSITE_PROJECTION, "skip": 12, "limit": 12}
+    sample = collection.find_one({}, {"name": 1})
+    if sample:
+        yield "營地頁", "find", {"filter": {"_id": sample["_id"]}, "projection": CAMPSITE_PROJECTION}
+        yield "依名稱查詢", "find", {"filter": {"name": sample.get("name")}, "projection": CAMPSITE_PROJECTION}
+    yield "尚未產生縮圖", "find", {"filter": {"thumbnails": {"$exists": False}}, "projection": {"image_urls": 1}}
+    yield "sitemap", "find", {
+        "filter": {},
+        "projection": {"updated_at": 1},
+        "sort": [("_id", 1)],
+    }
+    yield "附近的營地", "aggregate", {"pipeline": Campsite.nearest_pipeline(*AUDIT_POINT, 60)}
+
+    try:
+        popular = popular_searches(top_n)
+    except Exception as e:
+        logger.warning(f"讀取熱門搜尋失敗: {e}")
+        popular = []
+    plans = []
+    for query in list(AUDIT_QUERIES) + popular:
+        plan = plan_key(query)
+        if plan and plan not in plans:
+            plans.append(plan)
+    for plan in plans:
+        # 資料庫比對結構化條件的查詢（未安裝 NumPy 或欄位索引無法使用時）
+        yield f"搜尋 {plan}", "find", {
+            "filter": Campsite.search_query(*parse_query(plan)),
+            "projection": CAMPSITE_PROJECTION,
+        }
+
+
+def run_explain(kind: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    from models import collection, db
+
+    if kind == "aggregate":
+        return db.command(
+            "explain",
+            {"aggregate": collection.name, "pipeline": spec["pipeline"], "cursor": {}},
+            verbosity="executionStats",
+        )
+    cursor = collection.find(spec["filter"], spec.get("projection"))
+    if spec.get("sort"):
+        cursor = cursor.sort(spec["sort"])
+    if spec.get("skip"):
+        cursor = cursor.skip(spec["skip"])
+    if spec.get("limit"):
+        cursor = cursor.limit(spec["limit"])
+    return cursor.explain()
+
+
+def _find_key(document, key):
+    """在 explain 結果中找出第一個名為 key 的欄位（find 與 aggregate 的結構不同）"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        children = document.values()
+    elif isinstance(document, list):
+        children = document
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """查詢計畫中所有的 (stage, 索引名稱)"""
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        node = node.get("queryPlan", node)
+        stage = node.get("stage")
+        if stage:
+            index = node.get("indexName") or ("_id_" if stage in ID_STAGES else None)
+            stages.append((stage, index))
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", ()))
+    return stages
+
+
+def summarize(explain: Dict[str, Any]) -> Dict[str, Any]:
+    winning = _find_key(explain, "winningPlan") or {}
+    stats = _find_key(explain, "executionStats") or {}
+    stages = _plan_stages(winning)
+    return {
+        "stages": [stage for stage, _ in stages],
+        "indexes": sorted({index for _, index in stages if index}),
+        "collscan": any(stage == "COLLSCAN" for stage, _ in stages),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+        "ms": stats.get("executionTimeMillis"),
+    }
+
+
+def index_usage() -> Dict[str, int]:
+    """伺服器啟動後各索引的使用次數（$indexStats）"""
+    from models import collection
+
+    try:
+        return {doc["name"]: doc["accesses"]["ops"] for doc in collection.aggregate([{"$indexStats": {}}])}
+    except Exception as e:
+        logger.warning(f"讀取索引使用次數失敗: {e}")
+        return {}
+
+
+def index_plan() -> Dict[str, List[str]]:
+    """目前的索引與 CAMPSITE_INDEXES 的差異"""
+    from models import CAMPSITE_INDEXES, collection
+
+    existing = collection.index_information()
+    desired = [model.document["name"] for model in CAMPSITE_INDEXES]
+    return {
+        "create": [name for name in desired if name not in existing],
+        "drop": [name for name in existing if name != "_id_" and name not in desired],
+    }
+
+
+def audit(top_n: int = AUDIT_TOP_N) -> Dict[str, Any]:
+    """執行所有查詢的 explain()，回傳報告"""
+    from models import collection
+
+    queries = []
+    used = set()
+    for label, kind, spec in query_corpus(top_n):
+        try:
+            result = summarize(run_explain(kind, spec))
+        except Exception as e:
+            queries.append({"query": label, "error": str(e)})
+            continue
+        used.update(result["indexes"])
+        queries.append(dict(result, query=label))
+    existing = list(collection.index_information())
+    return {
+        "queries": queries,
+        "unused": [name for name in existing if name != "_id_" and name not in used],
+        "usage": index_usage(),
+        "plan": index_plan(),
+    }
+
+
+def apply_indexes(drop: bool = False) -> Dict[str, List[str]]:
+    """建立 CAMPSITE_INDEXES 中缺少的索引，drop 為 True 時刪除不在設定中的索引"""
+    from models import CAMPSITE_INDEXES, collection
+
+    plan = index_plan()
+    missing = [model for model in CAMPSITE_INDEXES if model.document["name"] in plan["create"]]
+    if missing:
+        collection.create_indexes(missing)
+    dropped = []
+    if drop:
+        for name in plan["drop"]:
+            collection.drop_index(name)
+            dropped.append(name)
+    return {"created": plan["create"], "dropped": dropped}
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'查詢':<28} {'計畫':<36} {'keys':>7} {'docs':>7} {'回傳':>7} {'ms':>5}")
+    for row in report["queries"]:
+        if "error" in row:
+            print(f"{row['query']:<28} 錯誤: {row['error']}")
+            continue
+        plan = "COLLSCAN" if row["collscan"] else "IXSCAN " + ",".join(row["indexes"])
+        warning = ""
+        if row["docs_examined"] and row["docs_examined"] > EXAMINED_RATIO_WARNING * max(row["returned"] or 0, 1):
+            warning = " ⚠️"
+        print(f"{row['query']:<28} {plan:<36} {row['keys_examined'] or 0:>7} "
+              f"{row['docs_examined'] or 0:>7} {row['returned'] or 0:>7} {row['ms'] or 0:>5}{warning}")
+    print()
+    print("查詢未使用的索引:", ", ".join(
+        f"{name}（啟動後使用 {report['usage'].get(name, '?')} 次）" for name in report["unused"]
+    ) or "無")
+    print("建議建立:", ", ".join(report["plan"]["create"]) or "無")
+    print("建議刪除:", ", ".join(report["plan"]["drop"]) or "無")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="資料庫索引檢查")
+    parser.add_argument("--top", type=int, default=AUDIT_TOP_N, help="加入檢查的熱門搜尋數")
+    parser.add_argument("--apply", action="store_true", help="建立 CAMPSITE_INDEXES 中缺少的索引")
+    parser.add_argument("--drop", action="store_true", help="與 --apply 一起使用，刪除不在設定中的索引")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print_report(audit(args.top))
+    if args.apply:
+        print("套用索引設定:", apply_indexes(drop=args.drop))
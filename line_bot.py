@@ -4,6 +4,8 @@ import hmac
 import base64
 import hashlib
 import logging
+import time
+import threading
 import requests
 from flask import abort
 from dotenv import load_dotenv
@@ -28,51 +30,54 @@ if not CHANNEL_ACCESS_TOKEN or not CHANNEL_SECRET:
 
 # 用戶搜尋狀態管理 - 使用快取優化
 from models import cache
-import time
+from state_store import create_state_backend, pack_state, unpack_state
+from postback_token import WizardTokenCodec
+from thumbnails import thumbnail_url
+from carriers import normalize_carriers
+from geography import REGION_CITIES
+from facets import get_facet_index
+from ranking import rank
+from suggest import suggest
+from line_bot_optimizations import (
+    encode_message,
+    prebuild_message,
+    prebuilt_template,
+    reply_deadline,
+    LineReplyClient,
+    OutboundDispatcher,
+    log_user_interaction,
+)
+from search_telemetry import record_search
 
 class UserStateManager:
-    """用戶狀態管理器 - 支援過期清理"""
-    def __init__(self):
-        self.states = {}
-        self.last_cleanup = time.time()
+    """用戶狀態管理器 - 委派至可插拔的狀態儲存後端"""
+    def __init__(self, backend=None):
+        self.backend = backend or create_state_backend()
     
     def get_state(self, user_id: str) -> Dict[str, Any]:
-        self._cleanup_expired()
-        return self.states.get(user_id, {})
+        values = self.backend.get(user_id)
+        return unpack_state(values) if values else {}
     
     def set_state(self, user_id: str, state: Dict[str, Any]):
-        self._cleanup_expired()
-        state['last_activity'] = time.time()
-        self.states[user_id] = state
+        self.backend.set(user_id, pack_state(state))
     
     def clear_state(self, user_id: str):
-        self.states.pop(user_id, None)
-    
-    def _cleanup_expired(self):
-        """清理超過30分鐘未活動的用戶狀態"""
-        current_time = time.time()
-        if current_time - self.last_cleanup < 300:  # 每5分鐘清理一次
-            return
-        
-        expired_users = []
-        for user_id, state in self.states.items():
-            if current_time - state.get('last_activity', 0) > 1800:  # 30分鐘過期
-                expired_users.append(user_id)
-        
-        for user_id in expired_users:
-            self.states.pop(user_id, None)
-        
-        self.last_cleanup = current_time
+        self.backend.delete(user_id)
 
 user_state_manager = UserStateManager()
 
-# 定義各區域的縣市
-REGION_CITIES = {
-    "北部": ["台北", "新北", "基隆", "新竹", "桃園", "宜蘭"],
-    "中部": ["台中", "苗栗", "彰化", "南投", "雲林"],
-    "南部": ["高雄", "台南", "嘉義", "屏東", "澎湖"],
-    "東部": ["花蓮", "台東"],
-}
+# 搜尋流程各步驟的選項
+REGION_OPTIONS = list(REGION_CITIES)
+ALTITUDE_OPTIONS = ["高海拔", "低海拔", "兩者皆可"]
+PET_OPTIONS = ["可帶寵物", "不可帶寵物", "兩者皆可"]
+PARKING_OPTIONS = ["車停營位旁", "集中停車", "兩者皆可"]
+QUICK_REPLY_LIMIT = 13  # LINE 快速回覆按鈕上限
+NEAREST_RESULTS = 10  # 傳送位置時回覆的營地數（一個輪播）
+QUICK_REPLY_LABEL_LENGTH = 20
+
+# 將已選條件簽章後編碼在 postback data 中，不保存伺服器端狀態
+STATELESS_WIZARD = os.getenv("LINE_STATELESS_WIZARD", "false").lower() in ("1", "true", "yes")
+wizard_codec = WizardTokenCodec(CHANNEL_SECRET)
 
 
 def verify_signature(request_body, signature):
@@ -83,14 +88,26 @@ def verify_signature(request_body, signature):
     return hmac.compare_digest(calculated_signature, signature)
 
 
-def send_line_message(reply_token, messages):
-    """發送 LINE 訊息 - 優化版本"""
-    url = "https://api.line.me/v2/bot/message/reply"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {CHANNEL_ACCESS_TOKEN}",
-    }
-    
+# 目前處理中事件的回覆期限（每個執行緒各自獨立）
+_reply_context = threading.local()
+reply_client = LineReplyClient(CHANNEL_ACCESS_TOKEN)
+outbound_dispatcher = OutboundDispatcher(
+    reply_client,
+    rate=float(os.getenv("LINE_PUSH_RATE", 100)),
+)
+
+# 回覆權杖過期時是否改用 Push API（會計入每月訊息額度）
+PUSH_FALLBACK = os.getenv("LINE_PUSH_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+
+def set_reply_context(event):
+    """依事件的 timestamp 記錄回覆權杖的到期時間與發送對象"""
+    _reply_context.deadline = reply_deadline(event.get("timestamp"))
+    _reply_context.user_id = event.get("source", {}).get("userId")
+
+
+def send_line_message(reply_token, messages, deadline=None):
+    """發送 LINE 訊息 - 在回覆權杖期限內重試"""
     # 確保 messages 是列表格式
     if not isinstance(messages, list):
         messages = [messages]
@@ -100,36 +117,93 @@ def send_line_message(reply_token, messages):
         messages = messages[:5]
         logger.warning("訊息數量超過限制，已截取前5則")
     
-    data = {
-        "replyToken": reply_token,
-        "messages": messages,
-    }
+    # 預先序列化的模板直接拼接，不重新編碼
+    body = (
+        b'{"replyToken":'
+        + json.dumps(reply_token).encode("utf-8")
+        + b',"messages":['
+        + b",".join(encode_message(message) for message in messages)
+        + b"]}"
+    )
+
+    # 只在開發模式下記錄詳細訊息
+    if logger.level <= logging.DEBUG:
+        logger.debug(f"準備發送的訊息: {body.decode('utf-8')}")
+
+    if deadline is None:
+        deadline = getattr(_reply_context, "deadline", None) or reply_deadline()
 
     try:
-        # 只在開發模式下記錄詳細訊息
-        if logger.level <= logging.DEBUG:
-            logger.debug(f"準備發送的訊息: {json.dumps(data, ensure_ascii=False)}")
-        
-        response = requests.post(url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        
-        logger.info(f"LINE API 回應成功: {response.status_code}")
-        return True
-        
-    except requests.exceptions.Timeout:
-        logger.error("LINE API 請求超時")
-        return False
-    except requests.exceptions.RequestException as e:
-        logger.error(f"發送 LINE 訊息時發生錯誤: {str(e)}")
-        if hasattr(e, 'response') and e.response is not None:
-            logger.error(f"錯誤詳情: {e.response.text}")
-        return False
+        if reply_client.send(body, deadline):
+            return True
     except Exception as e:
         logger.error(f"發送訊息時發生未預期錯誤: {str(e)}")
         return False
 
+    # 處理太慢導致回覆權杖過期時，改以 Push API 送達
+    user_id = getattr(_reply_context, "user_id", None)
+    if PUSH_FALLBACK and user_id and time.time() >= deadline - reply_client.safety_margin:
+        logger.info("回覆權杖已過期，改用 Push API 發送")
+        return outbound_dispatcher.enqueue(user_id, messages)
+    return False
+
+
+def _option_postback_data(action, field, value, selections, index):
+    """產生選項按鈕的 postback data"""
+    if STATELESS_WIZARD:
+        return wizard_codec.encode(list(selections) + [index])
+    return json.dumps({"action": action, field: value})
+
+
+def _option_label(option, counts, index):
+    """選項按鈕文字，有計數時附上營地數"""
+    return option if counts is None else f"{option}（{counts[index]}）"
+
+
+def _option_visible(counts, index):
+    """計數為 0 的選項不顯示，避免選到沒有結果的條件"""
+    return counts is None or counts[index] > 0
+
+
+# 搜尋流程欄位對應的篩選項目
+WIZARD_FACETS = {
+    "region": "region",
+    "city": "city",
+    "altitude": "altitude",
+    "pet": "pets",
+    "parking": "parking",
+}
+
+
+def wizard_option_counts(state, field, options):
+    """依已選條件計算某一步各選項的營地數，無法計算或全為 0 時回傳 None（顯示全部選項）"""
+    # 搜尋只使用縣市而不使用區域，計數條件與搜尋一致
+    filters = tuple(
+        (WIZARD_FACETS[name], state[name])
+        for name in ("city", "altitude", "pet", "parking")
+        if name != field and state.get(name) and state[name] != "兩者皆可"
+    )
+    try:
+        counts = get_facet_index().counts(filters)
+    except Exception as e:
+        logger.warning(f"計算搜尋流程選項數量失敗: {e}")
+        return None
+    facet = counts[WIZARD_FACETS[field]]
+    result = tuple(
+        counts["total"] if option == "兩者皆可" else facet.get(option, 0) for option in options
+    )
+    return result if any(result) else None
+
+
+def _search_postback_data(selections):
+    """產生開始搜尋按鈕的 postback data"""
+    if STATELESS_WIZARD:
+        return wizard_codec.encode(selections, final=True)
+    return json.dumps({"action": "search_start"})
 
-def create_location_selection():
+
+@prebuilt_template()
+def create_location_selection(counts=None):
     """創建地區選擇介面"""
     region_display = {
         "北部": "我想去北部露營！",
@@ -178,12 +252,9 @@ def create_location_selection():
                                         "type": "button",
                                         "action": {
                                             "type": "postback",
-                                            "label": region,
-                                            "data": json.dumps(
-                                                {
-                                                    "action": "select_region",
-                                                    "region": region,
-                                                }
+                                            "label": _option_label(region, counts, index),
+                                            "data": _option_postback_data(
+                                                "select_region", "region", region, (), index
                                             ),
                                             "displayText": region_display[region],
                                         },
@@ -193,7 +264,8 @@ def create_location_selection():
                                     }
                                 ],
                             }
-                            for region in ["北部", "中部", "南部", "東部"]
+                            for index, region in enumerate(REGION_OPTIONS)
+                            if _option_visible(counts, index)
                         ],
                     },
                 ],
@@ -202,7 +274,8 @@ def create_location_selection():
     }
 
 
-def create_city_selection(region):
+@prebuilt_template()
+def create_city_selection(region, selections=(), counts=None):
     """創建縣市選擇介面"""
     region_images = {
         "北部": "https://i.pinimg.com/736x/90/e5/c3/90e5c33650b6d47d4d1684e647aa360c.jpg",
@@ -251,9 +324,9 @@ def create_city_selection(region):
                                         "type": "button",
                                         "action": {
                                             "type": "postback",
-                                            "label": city,
-                                            "data": json.dumps(
-                                                {"action": "select_city", "city": city}
+                                            "label": _option_label(city, counts, index),
+                                            "data": _option_postback_data(
+                                                "select_city", "city", city, selections, index
                                             ),
                                             "displayText": city,
                                         },
@@ -263,7 +336,8 @@ def create_city_selection(region):
                                     }
                                 ],
                             }
-                            for city in REGION_CITIES[region]
+                            for index, city in enumerate(REGION_CITIES[region])
+                            if _option_visible(counts, index)
                         ],
                     },
                 ],
@@ -272,7 +346,8 @@ def create_city_selection(region):
     }
 
 
-def create_altitude_selection():
+@prebuilt_template()
+def create_altitude_selection(selections=(), counts=None):
     """創建海拔選擇介面"""
     altitude_display = {
         "高海拔": "我想去高山上露營！",
@@ -320,12 +395,9 @@ def create_altitude_selection():
                                         "type": "button",
                                         "action": {
                                             "type": "postback",
-                                            "label": altitude,
-                                            "data": json.dumps(
-                                                {
-                                                    "action": "select_altitude",
-                                                    "altitude": altitude,
-                                                }
+                                            "label": _option_label(altitude, counts, index),
+                                            "data": _option_postback_data(
+                                                "select_altitude", "altitude", altitude, selections, index
                                             ),
                                             "displayText": altitude_display[altitude],
                                         },
@@ -335,7 +407,8 @@ def create_altitude_selection():
                                     }
                                 ],
                             }
-                            for altitude in ["高海拔", "低海拔", "兩者皆可"]
+                            for index, altitude in enumerate(ALTITUDE_OPTIONS)
+                            if _option_visible(counts, index)
                         ],
                     },
                 ],
@@ -344,7 +417,8 @@ def create_altitude_selection():
     }
 
 
-def create_pet_selection():
+@prebuilt_template()
+def create_pet_selection(selections=(), counts=None):
     """創建寵物選擇介面"""
     pet_display = {
         "可帶寵物": "我要帶毛小孩一起去！",
@@ -392,12 +466,9 @@ def create_pet_selection():
                                         "type": "button",
                                         "action": {
                                             "type": "postback",
-                                            "label": pet_option,
-                                            "data": json.dumps(
-                                                {
-                                                    "action": "select_pet",
-                                                    "pet": pet_option,
-                                                }
+                                            "label": _option_label(pet_option, counts, index),
+                                            "data": _option_postback_data(
+                                                "select_pet", "pet", pet_option, selections, index
                                             ),
                                             "displayText": pet_display[pet_option],
                                         },
@@ -407,7 +478,8 @@ def create_pet_selection():
                                     }
                                 ],
                             }
-                            for pet_option in ["可帶寵物", "不可帶寵物", "兩者皆可"]
+                            for index, pet_option in enumerate(PET_OPTIONS)
+                            if _option_visible(counts, index)
                         ],
                     },
                 ],
@@ -416,7 +488,8 @@ def create_pet_selection():
     }
 
 
-def create_parking_selection():
+@prebuilt_template()
+def create_parking_selection(selections=(), counts=None):
     """創建停車選擇介面"""
     parking_display = {
         "車停營位旁": "想把車停在帳篷旁邊！",
@@ -464,12 +537,9 @@ def create_parking_selection():
                                         "type": "button",
                                         "action": {
                                             "type": "postback",
-                                            "label": parking_option,
-                                            "data": json.dumps(
-                                                {
-                                                    "action": "select_parking",
-                                                    "parking": parking_option,
-                                                }
+                                            "label": _option_label(parking_option, counts, index),
+                                            "data": _option_postback_data(
+                                                "select_parking", "parking", parking_option, selections, index
                                             ),
                                             "displayText": parking_display[
                                                 parking_option
@@ -481,7 +551,8 @@ def create_parking_selection():
                                     }
                                 ],
                             }
-                            for parking_option in ["車停營位旁", "集中停車", "兩者皆可"]
+                            for index, parking_option in enumerate(PARKING_OPTIONS)
+                            if _option_visible(counts, index)
                         ],
                     },
                 ],
@@ -490,7 +561,8 @@ def create_parking_selection():
     }
 
 
-def create_search_button():
+@prebuilt_template()
+def create_search_button(selections=()):
     """創建搜索營地按鈕"""
     return {
         "type": "flex",
@@ -522,7 +594,7 @@ def create_search_button():
                                 "action": {
                                     "type": "postback",
                                     "label": "GO！",
-                                    "data": json.dumps({"action": "search_start"}),
+                                    "data": _search_postback_data(selections),
                                     "displayText": "GO！",
                                 },
                                 "style": "link",
@@ -537,6 +609,7 @@ def create_search_button():
     }
 
 
+@prebuilt_template()
 def create_go_button():
     """創建GO按鈕介面"""
     return {
@@ -581,16 +654,57 @@ def create_go_button():
     }
 
 
+def location_selection_message():
+    """附上各區域營地數的地區選擇介面"""
+    return create_location_selection.prebuilt(
+        wizard_option_counts({}, "region", REGION_OPTIONS)
+    )
+
+
+def _sample_counts(options):
+    """驗證用的選項數量：不顯示數量、全部有營地、只有第一個選項有營地"""
+    return (None, (1,) * len(options), (1,) + (0,) * (len(options) - 1))
+
+
+def validate_templates():
+    """worker 啟動時建立並驗證所有選單模板一次，格式錯誤時拋出 ValueError
+
+    不放入 prebuilt 快取；實際回覆時依選項數量建立的序列化結果仍在第一次使用時快取
+    """
+    def steps(depth):
+        # 無狀態模式的已選條件為各步驟選項的索引
+        return (0,) * depth if STATELESS_WIZARD else ()
+
+    builders = []
+    for counts in _sample_counts(REGION_OPTIONS):
+        builders.append(lambda counts=counts: create_location_selection(counts))
+    for index, region in enumerate(REGION_OPTIONS):
+        selections = (index,) if STATELESS_WIZARD else ()
+        for counts in _sample_counts(REGION_CITIES[region]):
+            builders.append(lambda r=region, s=selections, c=counts: create_city_selection(r, s, c))
+    for builder, options, depth in (
+        (create_altitude_selection, ALTITUDE_OPTIONS, 2),
+        (create_pet_selection, PET_OPTIONS, 3),
+        (create_parking_selection, PARKING_OPTIONS, 4),
+    ):
+        for counts in _sample_counts(options):
+            builders.append(lambda b=builder, d=depth, c=counts: b(steps(d), c))
+    builders.append(lambda: create_search_button(steps(5)))
+    builders.append(create_go_button)
+
+    for build in builders:
+        prebuild_message(build())
+    logger.info(f"已驗證 {len(builders)} 個選單模板")
+
+
 def safe_get_text(value, field_name=""):
     """安全地獲取文字內容，處理不同的資料類型"""
     if value is None:
         return "未知"
+    if field_name == "signal_strength":
+        return ", ".join(normalize_carriers(value))
     if isinstance(value, str):
-        return (
-            value.replace("有訊號", "").strip()
-            if field_name == "signal_strength"
-            else value
-        )
+        return value
     if isinstance(value, (list, tuple)):
         return ", ".join(map(str, value))
     return str(value)
@@ -606,7 +720,8 @@ def create_camp_bubble(camp):
         "hero": {
             "type": "image",
             "url": (
-                camp["image_urls"][0]
+                thumbnail_url(camp, "hero", external=True)
+                or camp["image_urls"][0]
                 if isinstance(camp.get("image_urls"), list) and camp["image_urls"]
                 else "https://example.com/default.jpg"
             ),
@@ -648,7 +763,8 @@ def create_camp_bubble(camp):
                                 },
                                 {
                                     "type": "text",
-                                    "text": f"地點：{safe_get_text(camp.get('location'))}",
+                                    "text": f"地點：{safe_get_text(camp.get('location'))}"
+                                    + (f"（約 {camp['distance'] / 1000:.0f} 公里）" if camp.get("distance") is not None else ""),
                                     "wrap": True,
                                     "color": "#666666",
                                     "size": "md",
@@ -903,8 +1019,50 @@ def create_next_page_bubble(current_page, total_pages, keyword):
     return next_page_bubble
 
 
+def suggestion_quick_reply(text):
+    """依使用者輸入的最後一個關鍵字提供搜尋建議按鈕，並附上傳送位置的按鈕"""
+    try:
+        suggestions = suggest(text, limit=QUICK_REPLY_LIMIT - 1, relax=True)
+    except Exception as e:
+        logger.warning(f"取得搜尋建議失敗: {e}")
+        suggestions = []
+    items = [
+        {
+            "type": "action",
+            "action": {
+                "type": "message",
+                "label": item["text"][:QUICK_REPLY_LABEL_LENGTH],
+                "text": item["query"],
+            },
+        }
+        for item in suggestions
+    ]
+    # 也可以直接傳送位置，搜尋附近的營地
+    items.append({"type": "action", "action": {"type": "location", "label": "搜尋附近營地"}})
+    return {"items": items}
+
+
+def handle_location(event, Campsite):
+    """收到位置訊息時，回覆距離最近的營地"""
+    set_reply_context(event)
+    message = event["message"]
+    try:
+        campsites = Campsite.nearest(message["latitude"], message["longitude"], limit=NEAREST_RESULTS)
+    except Exception as e:
+        logger.error(f"搜尋附近營地時發生錯誤: {e}")
+        campsites = []
+    if not campsites:
+        send_line_message(
+            event["replyToken"],
+            [{"type": "text", "text": "抱歉，附近找不到營區，請試試輸入地區或關鍵字🔎"}],
+        )
+        return
+    return handle_search_results(event["replyToken"], campsites, 1, "")
+
+
 def handle_message(event, Campsite):
     """處理收到的訊息"""
+    set_reply_context(event)
     message_text = event["message"]["text"].strip()
     user_id = event["source"]["userId"]
 
@@ -919,29 +1077,28 @@ def handle_message(event, Campsite):
         or message_text == "go"
     ):
         # 初始化用戶狀態
-        user_state_manager.set_state(user_id, {
-            "step": "region",
-            "region": None,
-            "city": None,
-            "altitude": None,
-            "pet": None,
-            "parking": None,
-        })
+        if not STATELESS_WIZARD:
+            user_state_manager.set_state(user_id, {
+                "step": "region",
+                "region": None,
+                "city": None,
+                "altitude": None,
+                "pet": None,
+                "parking": None,
+            })
         # 發送地區選擇介面
-        send_line_message(event["replyToken"], [create_location_selection()])
+        send_line_message(event["replyToken"], [location_selection_message()])
         return
 
     # 如果不是開始搜尋指令，使用原有的搜尋邏輯
+    log_user_interaction(user_id, "search", message_text)
     campsites = Campsite.search_by_keywords(message_text)
     current_page = 1
 
     if not campsites:
-        send_line_message(
-            event["replyToken"],
-            [
-                {
-                    "type": "text",
-                    "text": """抱歉，找不到符合的營區。
+        message = {
+            "type": "text",
+            "text": """抱歉，找不到符合的營區。
 請試試其他關鍵字🔎
 
 您可以：
@@ -950,9 +1107,10 @@ def handle_message(event, Campsite):
 例如：
    - 中部 海拔高
    - 北部 可帶寵物""",
-                }
-            ],
-        )
+        }
+        # 附上與輸入相近的關鍵字，點選即可重新搜尋
+        message["quickReply"] = suggestion_quick_reply(message_text)
+        send_line_message(event["replyToken"], [message])
         return
 
     return handle_search_results(
@@ -962,8 +1120,13 @@ def handle_message(event, Campsite):
 
 def handle_postback(event, Campsite):
     """處理 postback 事件"""
+    set_reply_context(event)
     try:
-        data = json.loads(event["postback"]["data"])
+        raw_data = event["postback"]["data"]
+        if WizardTokenCodec.is_token(raw_data):
+            return handle_wizard_token(event, Campsite, raw_data)
+
+        data = json.loads(raw_data)
         user_id = event["source"]["userId"]
 
         if data.get("action") == "next_page":
@@ -1026,7 +1189,8 @@ def handle_postback(event, Campsite):
             state = user_state_manager.get_state(user_id)
             state.update({"region": region, "step": "city"})
             user_state_manager.set_state(user_id, state)
-            send_line_message(event["replyToken"], [create_city_selection(region)])
+            counts = wizard_option_counts(state, "city", REGION_CITIES[region])
+            send_line_message(event["replyToken"], [create_city_selection.prebuilt(region, (), counts)])
 
         # 處理縣市選擇
         elif data.get("action") == "select_city":
@@ -1034,28 +1198,31 @@ def handle_postback(event, Campsite):
             state = user_state_manager.get_state(user_id)
             state.update({"city": city, "step": "altitude"})
             user_state_manager.set_state(user_id, state)
-            send_line_message(event["replyToken"], [create_altitude_selection()])
+            counts = wizard_option_counts(state, "altitude", ALTITUDE_OPTIONS)
+            send_line_message(event["replyToken"], [create_altitude_selection.prebuilt((), counts)])
 
         # 處理海拔選擇
         elif data.get("action") == "select_altitude":
             state = user_state_manager.get_state(user_id)
             state.update({"altitude": data.get("altitude", "兩者皆可"), "step": "pet"})
             user_state_manager.set_state(user_id, state)
-            send_line_message(event["replyToken"], [create_pet_selection()])
+            counts = wizard_option_counts(state, "pet", PET_OPTIONS)
+            send_line_message(event["replyToken"], [create_pet_selection.prebuilt((), counts)])
 
         # 處理寵物選擇
         elif data.get("action") == "select_pet":
             state = user_state_manager.get_state(user_id)
             state.update({"pet": data.get("pet", "兩者皆可"), "step": "parking"})
             user_state_manager.set_state(user_id, state)
-            send_line_message(event["replyToken"], [create_parking_selection()])
+            counts = wizard_option_counts(state, "parking", PARKING_OPTIONS)
+            send_line_message(event["replyToken"], [create_parking_selection.prebuilt((), counts)])
 
         # 處理停車選擇
         elif data.get("action") == "select_parking":
             state = user_state_manager.get_state(user_id)
             state.update({"parking": data.get("parking", "兩者皆可"), "step": "go"})
             user_state_manager.set_state(user_id, state)
-            send_line_message(event["replyToken"], [create_search_button()])
+            send_line_message(event["replyToken"], [create_search_button.prebuilt()])
 
         # 處理搜尋開始
         elif data.get("action") == "search_start":
@@ -1070,96 +1237,21 @@ def handle_postback(event, Campsite):
                 or state.get("step") != "go"
             ):
                 # 初始化用戶狀態並顯示地區選擇介面
-                user_state_manager.set_state(user_id, {
-                    "step": "region",
-                    "region": None,
-                    "city": None,
-                    "altitude": None,
-                    "pet": None,
-                    "parking": None,
-                })
-                send_line_message(
-                    event["replyToken"],
-                    [
-                        {
-                            "type": "text",
-                            "text": "讓我們重新開始搜尋吧！🔍\n請先選擇想去的地區：",
-                        },
-                        create_location_selection(),
-                    ],
-                )
+                if not STATELESS_WIZARD:
+                    user_state_manager.set_state(user_id, {
+                        "step": "region",
+                        "region": None,
+                        "city": None,
+                        "altitude": None,
+                        "pet": None,
+                        "parking": None,
+                    })
+                send_restart_message(event["replyToken"])
                 return
 
-            try:
-                # 構建搜尋關鍵字
-                keywords = []
-
-                # 使用選擇的縣市
-                city = state.get("city")
-                if city:
-                    keywords.append(city)
-
-                # 處理其他條件
-                if state.get("altitude") and state["altitude"] != "兩者皆可":
-                    keywords.append(state["altitude"])
-                if state.get("pet") and state["pet"] != "兩者皆可":
-                    keywords.append(state["pet"])
-                if state.get("parking") and state["parking"] != "兩者皆可":
-                    keywords.append(state["parking"])
-
-                # 執行搜尋
-                search_text = " ".join(filter(None, keywords))
-                logger.info(f"搜尋條件: {search_text}")  # 添加日誌
-                campsites = Campsite.search_by_keywords(search_text)
-                logger.info(f"找到 {len(campsites)} 個營區")  # 添加日誌
-
-                if not campsites:
-                    send_line_message(
-                        event["replyToken"],
-                        [
-                            {
-                                "type": "text",
-                                "text": f"抱歉，找不到符合以下條件的營區：\n- 地區：{city}\n"
-                                + (
-                                    f"- 海拔：{state['altitude']}\n"
-                                    if state.get("altitude")
-                                    and state["altitude"] != "兩者皆可"
-                                    else ""
-                                )
-                                + (
-                                    f"- 寵物：{state['pet']}\n"
-                                    if state.get("pet") and state["pet"] != "兩者皆可"
-                                    else ""
-                                )
-                                + (
-                                    f"- 停車：{state['parking']}"
-                                    if state.get("parking")
-                                    and state["parking"] != "兩者皆可"
-                                    else ""
-                                )
-                                + "\n請嘗試放寬搜尋條件。",
-                            }
-                        ],
-                    )
-                else:
-                    # 清除用戶狀態
-                    user_state_manager.clear_state(user_id)
-                    # 顯示搜尋結果
-                    return handle_search_results(
-                        event["replyToken"], campsites, 1, search_text
-                    )
-
-            except Exception as e:
-                logger.error(f"搜尋過程中發生錯誤: {str(e)}")
-                send_line_message(
-                    event["replyToken"],
-                    [
-                        {
-                            "type": "text",
-                            "text": "抱歉，搜尋過程中發生錯誤。請重新搜尋。",
-                        }
-                    ],
-                )
+            if search_with_state(event["replyToken"], Campsite, state):
+                # 清除用戶狀態
+                user_state_manager.clear_state(user_id)
 
     except Exception as e:
         logger.error(f"處理 postback 時發生錯誤: {str(e)}")
@@ -1169,6 +1261,162 @@ def handle_postback(event, Campsite):
         )
 
 
+def send_restart_message(reply_token):
+    """提示用戶重新開始篩選搜尋"""
+    send_line_message(
+        reply_token,
+        [
+            {
+                "type": "text",
+                "text": "讓我們重新開始搜尋吧！🔍\n請先選擇想去的地區：",
+            },
+            location_selection_message(),
+        ],
+    )
+
+
+def search_with_state(reply_token, Campsite, state):
+    """依搜尋流程的條件執行搜尋並回覆結果，有結果時回傳 True"""
+    try:
+        # 構建搜尋關鍵字
+        keywords = []
+
+        # 使用選擇的縣市
+        city = state.get("city")
+        if city:
+            keywords.append(city)
+
+        # 處理其他條件
+        if state.get("altitude") and state["altitude"] != "兩者皆可":
+            keywords.append(state["altitude"])
+        if state.get("pet") and state["pet"] != "兩者皆可":
+            keywords.append(state["pet"])
+        if state.get("parking") and state["parking"] != "兩者皆可":
+            keywords.append(state["parking"])
+
+        # 執行搜尋
+        search_text = " ".join(filter(None, keywords))
+        logger.info(f"搜尋條件: {search_text}")  # 添加日誌
+        record_search(search_text)
+        campsites = Campsite.search_by_keywords(search_text)
+        logger.info(f"找到 {len(campsites)} 個營區")  # 添加日誌
+
+        if not campsites:
+            send_line_message(
+                reply_token,
+                [
+                    {
+                        "type": "text",
+                        "text": f"抱歉，找不到符合以下條件的營區：\n- 地區：{city}\n"
+                        + (
+                            f"- 海拔：{state['altitude']}\n"
+                            if state.get("altitude")
+                            and state["altitude"] != "兩者皆可"
+                            else ""
+                        )
+                        + (
+                            f"- 寵物：{state['pet']}\n"
+                            if state.get("pet") and state["pet"] != "兩者皆可"
+                            else ""
+                        )
+                        + (
+                            f"- 停車：{state['parking']}"
+                            if state.get("parking")
+                            and state["parking"] != "兩者皆可"
+                            else ""
+                        )
+                        + "\n請嘗試放寬搜尋條件。",
+                    }
+                ],
+            )
+            return False
+
+        # 顯示搜尋結果
+        handle_search_results(reply_token, campsites, 1, search_text)
+        return True
+
+    except Exception as e:
+        logger.error(f"搜尋過程中發生錯誤: {str(e)}")
+        send_line_message(
+            reply_token,
+            [
+                {
+                    "type": "text",
+                    "text": "抱歉，搜尋過程中發生錯誤。請重新搜尋。",
+                }
+            ],
+        )
+        return False
+
+
+def selections_to_state(selections):
+    """將 postback 中的選項索引還原為搜尋條件，索引無效時拋出 ValueError"""
+    fields = ("region", "city", "altitude", "pet", "parking")
+    if len(selections) > len(fields):
+        raise ValueError("選項數量無效")
+
+    state = dict.fromkeys(fields)
+    for field, index in zip(fields, selections):
+        if field == "region":
+            options = REGION_OPTIONS
+        elif field == "city":
+            options = REGION_CITIES[state["region"]]
+        elif field == "altitude":
+            options = ALTITUDE_OPTIONS
+        elif field == "pet":
+            options = PET_OPTIONS
+        else:
+            options = PARKING_OPTIONS
+        if index >= len(options):
+            raise ValueError(f"{field} 選項索引無效: {index}")
+        state[field] = options[index]
+
+    steps = ("region", "city", "altitude", "pet", "parking", "go")
+    state["step"] = steps[len(selections)]
+    return state
+
+
+def handle_wizard_token(event, Campsite, raw_data):
+    """處理編碼於 postback data 中的搜尋流程，不讀寫任何用戶狀態"""
+    reply_token = event["replyToken"]
+    decoded = wizard_codec.decode(raw_data)
+    try:
+        if decoded is None:
+            raise ValueError("postback 簽章無效")
+        selections, final = decoded
+        state = selections_to_state(selections)
+    except ValueError as e:
+        logger.warning(f"無效的搜尋流程資料: {e}")
+        send_restart_message(reply_token)
+        return
+
+    if final:
+        if state["step"] != "go":
+            send_restart_message(reply_token)
+            return
+        search_with_state(reply_token, Campsite, state)
+        return
+
+    step = state["step"]
+    if step == "city":
+        counts = wizard_option_counts(state, "city", REGION_CITIES[state["region"]])
+        message = create_city_selection.prebuilt(state["region"], selections, counts)
+    elif step == "altitude":
+        counts = wizard_option_counts(state, "altitude", ALTITUDE_OPTIONS)
+        message = create_altitude_selection.prebuilt(selections, counts)
+    elif step == "pet":
+        counts = wizard_option_counts(state, "pet", PET_OPTIONS)
+        message = create_pet_selection.prebuilt(selections, counts)
+    elif step == "parking":
+        counts = wizard_option_counts(state, "parking", PARKING_OPTIONS)
+        message = create_parking_selection.prebuilt(selections, counts)
+    elif step == "go":
+        message = create_search_button.prebuilt(selections)
+    else:
+        message = location_selection_message()
+    send_line_message(reply_token, [message])
+
+
 def handle_search_results(reply_token, campsites, current_page, keyword):
     """處理搜尋結果的顯示邏輯"""
     try:
@@ -1183,6 +1431,9 @@ def handle_search_results(reply_token, campsites, current_page, keyword):
             )
             return
 
+        # 依相關性排出到目前頁面為止的前幾筆
+        campsites = rank(campsites, keyword, limit=current_page * 10)
+
         start_idx = (current_page - 1) * 10
         end_idx = min(start_idx + 10, len(campsites))
         current_campsites = campsites[start_idx:end_idx]
@@ -3,31 +3,190 @@ LINE Bot 優化功能模組
 包含快取、批次處理、錯誤恢復等功能
 """
 
+import os
 import json
+import uuid
+import heapq
+import bisect
+import random
 import logging
-from typing import List, Dict, Any
-from functools import wraps
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Dict, Any, Optional
+from functools import lru_cache
 import time
 
+import requests
+
 logger = logging.getLogger(__name__)
 
-def retry_on_failure(max_retries=3, delay=1):
-    """重試裝飾器 - 用於 LINE API 調用失敗時重試"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logger.error(f"函數 {func.__name__} 在 {max_retries} 次嘗試後仍然失敗: {e}")
-                        raise
-                    logger.warning(f"函數 {func.__name__} 第 {attempt + 1} 次嘗試失敗，{delay} 秒後重試: {e}")
-                    time.sleep(delay)
-            return None
-        return wrapper
-    return decorator
+# 回覆權杖的有效時間（秒），以事件的 timestamp 起算
+REPLY_TOKEN_TTL = float(os.getenv("LINE_REPLY_TOKEN_TTL", 60))
+
+def reply_deadline(event_timestamp_ms: Optional[int] = None, ttl: float = REPLY_TOKEN_TTL) -> float:
+    """計算回覆權杖的到期時間（epoch 秒）"""
+    if event_timestamp_ms:
+        return event_timestamp_ms / 1000 + ttl
+    return time.time() + ttl
+
+class CircuitBreaker:
+    """斷路器 - API 連續失敗時暫停呼叫，避免執行緒卡在注定失敗的請求上"""
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.recovery_timeout:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        """斷路器開啟期間拒絕請求；冷卻後放行一次試探請求"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.recovery_timeout:
+                # 半開狀態：重新計時，只讓這一次請求通過
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.error(f"LINE API 連續失敗 {self.failures} 次，斷路器開啟")
+                self.opened_at = time.time()
+
+class LatencyHistogram:
+    """延遲直方圖（秒）"""
+    def __init__(self, buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            count = sum(self.counts)
+            labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+            return {
+                "buckets": dict(zip(labels, self.counts)),
+                "count": count,
+                "avg": self.total / count if count else 0.0,
+            }
+
+class LineReplyClient:
+    """LINE 回覆 API 用戶端
+
+    只在回覆權杖剩餘的時間內以隨機退避重試，超過期限的請求直接放棄；
+    暫時性錯誤持續發生時由斷路器擋下後續請求。
+    """
+    REPLY_URL = "https://api.line.me/v2/bot/message/reply"
+
+    def __init__(self, access_token: str, max_attempts=3, max_timeout=10,
+                 backoff_base=0.25, backoff_cap=2.0, safety_margin=0.5, breaker=None):
+        self.max_attempts = max_attempts
+        self.max_timeout = max_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.safety_margin = safety_margin
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyHistogram()
+        self.failure_reasons = Counter()   # 每次 send() 最終失敗的原因（一次呼叫只記一次）
+        self.attempt_failures = Counter()  # 每次請求失敗的原因（含之後重試成功的）
+        self.sent = 0
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json; charset=utf-8",
+            "Authorization": f"Bearer {access_token}",
+        })
+
+    def _fail(self, reason: str) -> bool:
+        self.failure_reasons[reason] += 1
+        return False
+
+    def send(self, body: bytes, deadline: float, url: str = REPLY_URL,
+             headers: Optional[Dict[str, str]] = None) -> bool:
+        """在期限內送出請求，成功時回傳 True"""
+        reason = "retries_exhausted"
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.time() - self.safety_margin
+            if remaining <= 0:
+                logger.warning("回覆權杖已過期，放棄發送")
+                return self._fail("deadline_expired")
+            if not self.breaker.allow_request():
+                logger.warning("斷路器開啟中，略過 LINE API 請求")
+                return self._fail("circuit_open")
+
+            started = time.time()
+            retryable = True
+            try:
+                response = self.session.post(
+                    url, data=body, headers=headers, timeout=min(self.max_timeout, remaining)
+                )
+                self.latency.observe(time.time() - started)
+                if response.status_code < 300:
+                    self.breaker.record_success()
+                    self.sent += 1
+                    logger.info(f"LINE API 回應成功: {response.status_code}")
+                    return True
+                reason = f"http_{response.status_code}"
+                # 4xx（429 除外）是請求本身的問題，重試無益且不代表 API 故障
+                retryable = response.status_code == 429 or response.status_code >= 500
+                logger.error(f"發送 LINE 訊息時發生錯誤: {response.status_code} {response.text[:200]}")
+            except requests.exceptions.Timeout:
+                self.latency.observe(time.time() - started)
+                reason = "timeout"
+                logger.error("LINE API 請求超時")
+            except requests.exceptions.RequestException as e:
+                reason = "connection_error"
+                logger.error(f"發送 LINE 訊息時發生錯誤: {str(e)}")
+
+            self.attempt_failures[reason] += 1
+            if not retryable:
+                self.breaker.record_success()
+                return self._fail(reason)
+
+            self.breaker.record_failure()
+            if attempt == self.max_attempts - 1:
+                break
+
+            # Full jitter 退避，若等待後已無剩餘時間則不再重試
+            backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            if time.time() + backoff >= deadline - self.safety_margin:
+                return self._fail("deadline_exhausted")
+            time.sleep(backoff)
+
+        # 重試次數用完，以最後一次的錯誤為最終原因
+        return self._fail(reason)
+
+    def stats(self) -> Dict[str, Any]:
+        """回覆統計資訊"""
+        return {
+            "sent": self.sent,
+            "circuit_state": self.breaker.state,
+            "failure_reasons": dict(self.failure_reasons),
+            "attempt_failures": dict(self.attempt_failures),
+            "latency": self.latency.snapshot(),
+        }
 
 def validate_flex_message(message: Dict[str, Any]) -> bool:
     """驗證 Flex Message 格式是否正確"""
@@ -38,6 +197,9 @@ def validate_flex_message(message: Dict[str, Any]) -> bool:
         if message.get('type') != 'flex':
             return False
         
+        if not isinstance(message.get('altText'), str) or not message['altText']:
+            return False
+        
         contents = message.get('contents')
         if not contents:
             return False
@@ -50,6 +212,36 @@ def validate_flex_message(message: Dict[str, Any]) -> bool:
     except Exception:
         return False
 
+class PrebuiltMessage:
+    """預先序列化的訊息 - 回覆時直接拼接進請求內容，不需重建或重新編碼"""
+    __slots__ = ('payload',)
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+def encode_message(message) -> bytes:
+    """將訊息序列化為 JSON bytes"""
+    if isinstance(message, PrebuiltMessage):
+        return message.payload
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def prebuild_message(message: Dict[str, Any]) -> PrebuiltMessage:
+    """驗證並預先序列化 Flex Message，格式錯誤時拋出 ValueError"""
+    if not validate_flex_message(message):
+        raise ValueError(f"Flex Message 格式錯誤: {message.get('altText') if isinstance(message, dict) else message!r}")
+    return PrebuiltMessage(encode_message(message))
+
+def prebuilt_template(maxsize=1024):
+    """模板快取裝飾器 - 為訊息建構函數加上 .prebuilt(*args)，
+    依參數快取驗證過並序列化的結果"""
+    def decorator(builder):
+        @lru_cache(maxsize=maxsize)
+        def prebuilt(*args):
+            return prebuild_message(builder(*args))
+        builder.prebuilt = prebuilt
+        return builder
+    return decorator
+
 def optimize_image_urls(camp_data: Dict[str, Any]) -> Dict[str, Any]:
     """優化營地圖片 URL，確保可用性"""
     if not camp_data.get('image_urls'):
@@ -90,47 +282,151 @@ def batch_process_campsites(campsites: List[Dict[str, Any]], batch_size: int = 1
         batches.append(batch)
     return batches
 
-class MessageQueue:
-    """訊息佇列管理器 - 避免訊息發送過於頻繁"""
-    def __init__(self, max_size=100):
-        self.queue = []
+class TokenBucket:
+    """權杖桶限流器"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """嘗試取得權杖，成功回傳 0，否則回傳需要等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+class OutboundDispatcher:
+    """推播訊息派送器 - 回覆權杖過期時改用 Push API 送達
+
+    待送訊息依可發送時間放入 heap；同一用戶的訊息至少間隔
+    per_user_interval 秒，所有 API 呼叫共用一個權杖桶以符合 LINE 的
+    速率限制。同一批次中內容相同的訊息會合併為 multicast 發送。
+    """
+    PUSH_URL = "https://api.line.me/v2/bot/message/push"
+    MULTICAST_URL = "https://api.line.me/v2/bot/message/multicast"
+    MULTICAST_LIMIT = 500  # multicast 單次最多 500 位用戶
+
+    def __init__(self, client: LineReplyClient, max_size=1000, rate=100, burst=20,
+                 per_user_interval=1.0, batch_window=0.2, send_timeout=30):
+        self.client = client
         self.max_size = max_size
-        self.last_send_time = {}
-        self.min_interval = 1  # 最小發送間隔（秒）
-    
-    def can_send(self, user_id: str) -> bool:
-        """檢查是否可以向用戶發送訊息"""
-        current_time = time.time()
-        last_time = self.last_send_time.get(user_id, 0)
-        return current_time - last_time >= self.min_interval
-    
-    def mark_sent(self, user_id: str):
-        """標記已向用戶發送訊息"""
-        self.last_send_time[user_id] = time.time()
-    
-    def add_message(self, user_id: str, reply_token: str, messages: List[Dict[str, Any]]):
-        """添加訊息到佇列"""
-        if len(self.queue) >= self.max_size:
-            self.queue.pop(0)  # 移除最舊的訊息
-        
-        self.queue.append({
-            'user_id': user_id,
-            'reply_token': reply_token,
-            'messages': messages,
-            'timestamp': time.time()
-        })
+        self.per_user_interval = per_user_interval
+        self.batch_window = batch_window
+        self.send_timeout = send_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self._heap = []  # (ready_at, seq, user_id, payload)
+        self._seq = 0
+        self._next_allowed = OrderedDict()  # user_id -> 下次可發送時間（依時間排序）
+        self._cond = threading.Condition()
+        self._worker = None
+        self.stats_counter = Counter()
+
+    def enqueue(self, user_id: str, messages: List[Any]) -> bool:
+        """將訊息加入佇列，佇列已滿時回傳 False"""
+        payload = b",".join(encode_message(message) for message in messages)
+        with self._cond:
+            if len(self._heap) >= self.max_size:
+                self.stats_counter["dropped"] += 1
+                logger.warning("推播佇列已滿，捨棄訊息")
+                return False
+            now = time.time()
+            self._prune_rate_limits(now)
+            ready_at = max(now, self._next_allowed.get(user_id, 0))
+            self._next_allowed[user_id] = ready_at + self.per_user_interval
+            self._next_allowed.move_to_end(user_id)
+            self._seq += 1
+            heapq.heappush(self._heap, (ready_at, self._seq, user_id, payload))
+            self.stats_counter["enqueued"] += 1
+            self._ensure_worker()
+            self._cond.notify()
+        return True
+
+    def _prune_rate_limits(self, now: float):
+        """移除已不再限制的用戶，避免記錄無限成長"""
+        while self._next_allowed:
+            if next(iter(self._next_allowed.values())) > now:
+                break
+            self._next_allowed.popitem(last=False)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="line-outbound", daemon=True)
+            self._worker.start()
+
+    def _next_batch(self) -> List[tuple]:
+        """等待並取出一批已可發送的訊息"""
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+        # 稍候片刻，讓同時段的相同內容能合併為 multicast
+        time.sleep(self.batch_window)
+        batch = []
+        with self._cond:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                batch.append(heapq.heappop(self._heap))
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                groups = OrderedDict()
+                for _, _, user_id, payload in self._next_batch():
+                    groups.setdefault(payload, []).append(user_id)
+                for payload, user_ids in groups.items():
+                    for i in range(0, len(user_ids), self.MULTICAST_LIMIT):
+                        self._deliver(user_ids[i:i + self.MULTICAST_LIMIT], payload)
+            except Exception as e:
+                logger.error(f"推播派送時發生錯誤: {e}")
+
+    def _deliver(self, user_ids: List[str], payload: bytes):
+        wait = self.bucket.acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.bucket.acquire()
+
+        if len(user_ids) == 1:
+            url, to, kind = self.PUSH_URL, user_ids[0], "push"
+        else:
+            url, to, kind = self.MULTICAST_URL, user_ids, "multicast"
+        body = b'{"to":' + json.dumps(to).encode("utf-8") + b',"messages":[' + payload + b"]}"
+        # 相同的 retry key 讓 LINE 忽略重試造成的重複發送
+        headers = {"X-Line-Retry-Key": str(uuid.uuid4())}
+        if self.client.send(body, time.time() + self.send_timeout, url=url, headers=headers):
+            self.stats_counter[f"{kind}_sent"] += 1
+        else:
+            self.stats_counter[f"{kind}_failed"] += 1
 
-# 全域訊息佇列實例
-message_queue = MessageQueue()
+    def stats(self) -> Dict[str, Any]:
+        """派送統計資訊"""
+        return {
+            "queued": len(self._heap),
+            "tracked_users": len(self._next_allowed),
+            **self.stats_counter,
+        }
 
 def log_user_interaction(user_id: str, action: str, details: str = ""):
-    """記錄用戶互動日誌（用於分析和優化）"""
+    """記錄用戶互動日誌（用於分析和優化），搜尋另外計入熱門搜尋統計"""
     logger.info(f"用戶互動 - ID: {user_id[:8]}..., 動作: {action}, 詳情: {details}")
+    if action == "search":
+        from search_telemetry import record_search
+        record_search(details)
 
-def get_popular_searches() -> List[str]:
+def get_popular_searches(n: int = 10) -> List[str]:
     """獲取熱門搜尋關鍵字（可用於推薦）"""
-    # 這裡可以從資料庫或快取中獲取熱門搜尋
-    return ["台中", "高海拔", "可帶寵物", "車停營位旁", "北部"]
+    from search_telemetry import popular_searches
+    return popular_searches(n)
 
 if __name__ == "__main__":
     # 測試優化功能
@@ -0,0 +1,162 @@
+"""
+資料庫結構版本與遷移
+索引建立與既有資料的補齊依序編號，目前版本存於 meta 集合，
+部署時以命令列執行一次尚未套用的遷移；worker 啟動時只以一次查詢確認版本
+
+使用方式:
+    python migrations.py            # 套用所有尚未執行的遷移
+    python migrations.py --status   # 顯示目前版本與待執行的遷移
+    python migrations.py --to 3     # 只套用到指定版本
+"""
+
+import time
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DOC_ID = "schema"
+# 舊版 create_indexes 建立、查詢已不使用的索引（見 index_audit.py）
+OBSOLETE_INDEXES = (
+    "location_1",
+    "altitude_1",
+    "pets_1",
+    "parking_1",
+    "location_1_pets_1",
+    "name_text_location_text_features_text",
+    "county_1",
+    "region_1",
+)
+
+
+def _create_indexes():
+    from models import create_indexes
+    create_indexes()
+
+
+def _backfill_search_tokens():
+    from text_index import backfill_search_tokens
+    backfill_search_tokens()
+
+
+def _backfill_geo():
+    from geocode import backfill_geo
+    backfill_geo()
+
+
+def _backfill_locations():
+    from geography import backfill_locations
+    backfill_locations()
+
+
+def _backfill_carriers():
+    from carriers import backfill_carriers
+    backfill_carriers()
+
+
+def _reclassify_locations():
+    _backfill_locations()
+    _backfill_geo()
+
+
+def _drop_obsolete_indexes():
+    from models import collection
+
+    existing = collection.index_information()
+    for name in OBSOLETE_INDEXES:
+        if name in existing:
+            collection.drop_index(name)
+            logger.info(f"已刪除索引 {name}")
+
+
+# (版本, 說明, 執行函數)；每個遷移都可重複執行，新增時只能加在最後
+MIGRATIONS: List[Tuple[int, str, Callable[[], None]]] = [
+    (1, "建立索引", _create_indexes),
+    (2, "補上關鍵字詞陣列 search_tokens", _backfill_search_tokens),
+    (3, "補上營地座標 geo", _backfill_geo),
+    (4, "補上縣市與區域 county、region", _backfill_locations),
+    (5, "通訊資訊轉為電信業者代碼陣列", _backfill_carriers),
+    (6, "刪除不再使用的索引", _drop_obsolete_indexes),
+    (7, "以地址中最早出現的縣市重新解析縣市、區域與座標", _reclassify_locations),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version() -> int:
+    """資料庫目前的結構版本（尚未執行過遷移時為 0）"""
+    from models import meta
+
+    doc = meta.find_one({"_id": SCHEMA_DOC_ID}, {"version": 1}) or {}
+    return doc.get("version", 0)
+
+
+def pending_migrations(current: int, target: int = SCHEMA_VERSION):
+    return [migration for migration in MIGRATIONS if current < migration[0] <= target]
+
+
+def migrate(target: Optional[int] = None) -> List[Dict[str, object]]:
+    """依序執行尚未套用的遷移，每完成一個就寫入版本，中斷後重新執行會從下一個繼續"""
+    from models import bump_data_version, meta
+
+    target = SCHEMA_VERSION if target is None else target
+    applied = []
+    for version, description, run in pending_migrations(schema_version(), target):
+        logger.info(f"執行遷移 {version}: {description}")
+        started = time.monotonic()
+        run()
+        seconds = round(time.monotonic() - started, 2)
+        meta.update_one(
+            {"_id": SCHEMA_DOC_ID},
+            {
+                "$set": {"version": version, "updated_at": datetime.now(timezone.utc)},
+                "$push": {"history": {"version": version, "description": description, "seconds": seconds}},
+            },
+            upsert=True,
+        )
+        applied.append({"version": version, "description": description, "seconds": seconds})
+    if applied:
+        # 補齊的欄位會影響搜尋結果與記憶體索引，讓各 worker 重新建立
+        bump_data_version()
+    return applied
+
+
+_schema_check = {"version": None, "ok": None}
+
+
+def check_schema() -> bool:
+    """worker 啟動時確認資料庫版本（一次查詢），落後時記錄警告但不阻擋啟動"""
+    try:
+        version = schema_version()
+    except Exception as e:
+        logger.warning(f"無法確認資料庫結構版本: {e}")
+        return False
+    _schema_check.update(version=version, ok=version >= SCHEMA_VERSION)
+    if version < SCHEMA_VERSION:
+        logger.warning(
+            f"資料庫結構版本 {version} 落後於 {SCHEMA_VERSION}，請執行 python migrations.py"
+        )
+    return _schema_check["ok"]
+
+
+def schema_status() -> dict:
+    """最近一次啟動檢查的結果（不另外查詢資料庫）"""
+    return dict(_schema_check, expected=SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="資料庫結構遷移")
+    parser.add_argument("--status", action="store_true", help="只顯示目前版本與待執行的遷移")
+    parser.add_argument("--to", type=int, default=SCHEMA_VERSION, help="套用到指定版本")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    current = schema_version()
+    if args.status:
+        print(f"目前版本: {current} / 最新版本: {SCHEMA_VERSION}")
+        for version, description, _ in pending_migrations(current, args.to):
+            print(f"  待執行 {version}: {description}")
+    else:
+        applied = migrate(args.to)
+        print(f"已套用 {len(applied)} 個遷移，目前版本: {schema_version()}")
@@ -1,14 +1,22 @@
-from pymongo import MongoClient
-import re
+from pymongo import IndexModel, MongoClient, ReturnDocument
+from pymongo.errors import OperationFailure
 from typing import List, Dict, Any
 import os
 from dotenv import load_dotenv
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import time
+import threading
 from functools import wraps
 import hashlib
 import json
+from datetime import datetime, timezone
+from search_filters import mongo_conditions, altitude_band
+from query_normalizer import correct_query, parse_query, plan_key
+from text_index import document_tokens, keyword_condition
+from carriers import normalize_carriers
+from geocode import distance_meters, geo_fields
+from geography import classify_location
 
 # 載入環境變數
 load_dotenv()
@@ -24,6 +32,9 @@ client = MongoClient(
 db = client[os.getenv("MONGODB_DB")]
 collection = db[os.getenv("MONGODB_COLLECTION")]
 users = db['users']  # 新增用戶集合
+# 頁面不需要搜尋用的詞陣列，查詢時排除以減少傳輸量
+CAMPSITE_PROJECTION = {"search_tokens": 0}
+meta = db['meta']  # 資料版本等系統資訊
 
 # 簡單的記憶體快取實作
 class SimpleCache:
@@ -76,31 +87,57 @@ def cached(timeout=300):
         return wrapper
     return decorator
 
-# 建立索引
+# 資料版本號：營地資料每次變更時遞增，供頁面 ETag 與頁面快取使用
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", 5))  # 其他 worker 的變更最多延遲幾秒生效
+_data_version = {"value": 0, "expires": 0.0}
+
+def get_data_version() -> int:
+    """取得營地資料版本號（短暫快取於記憶體）"""
+    if time.time() < _data_version["expires"]:
+        return _data_version["value"]
+    doc = meta.find_one({"_id": "campsites"}) or {}
+    _data_version.update(value=doc.get("version", 0), expires=time.time() + DATA_VERSION_TTL)
+    return _data_version["value"]
+
+def bump_data_version() -> int:
+    """營地資料變更後遞增版本號"""
+    doc = meta.find_one_and_update(
+        {"_id": "campsites"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    _data_version.update(value=doc["version"], expires=time.time() + DATA_VERSION_TTL)
+    return doc["version"]
+
+def notify_campsite_changed(campsite_id, version: int) -> None:
+    """單一營地變更後，讓記憶體中的搜尋建議只更新該營地"""
+    from suggest import campsite_changed
+    campsite_changed(campsite_id, version)
+
+# 索引設定：依實際的查詢形式調整（以 python index_audit.py 檢查查詢計畫）
+CAMPSITE_INDEXES = [
+    # 依名稱查詢營地（爬蟲判斷是否已存在）
+    IndexModel([("name", 1)]),
+    # 縣市、區域條件：等值查詢使用前綴，尚未補上欄位的舊資料（null）在索引內比對地址 regex
+    IndexModel([("county", 1), ("location", 1)]),
+    IndexModel([("region", 1), ("location", 1)]),
+    # 通訊條件：電信業者代碼陣列（multikey 索引）
+    IndexModel([("signal_strength", 1)]),
+    # 一般關鍵字的 n-gram 詞陣列（multikey 索引）
+    IndexModel([("search_tokens", 1)]),
+    # 依距離查詢最近的營地
+    IndexModel([("geo", "2dsphere")]),
+    # sitemap 依 _id 掃描並只讀取 updated_at，可由索引直接回應
+    IndexModel([("_id", 1), ("updated_at", 1)]),
+]
+
+# 建立索引（由 migrations.py 執行，不在載入模組時執行）
 def create_indexes():
-    """建立資料庫索引以提升查詢效能"""
-    try:
-        # 為常用查詢欄位建立索引
-        collection.create_index("name")
-        collection.create_index("location")
-        collection.create_index("altitude")
-        collection.create_index("pets")
-        collection.create_index("parking")
-        collection.create_index("signal_strength")
-        
-        # 建立複合索引
-        collection.create_index([("location", 1), ("pets", 1)])
-        collection.create_index([("name", "text"), ("location", "text"), ("features", "text")])
-        
-        # 用戶集合索引
-        users.create_index("username", unique=True)
-        
-        print("✅ 資料庫索引建立完成")
-    except Exception as e:
-        print(f"⚠️ 索引建立警告: {e}")
-
-# 初始化時建立索引
-create_indexes()
+    """建立資料庫索引以提升查詢效能（已存在的索引不會重建）"""
+    collection.create_indexes(CAMPSITE_INDEXES)
+    # 熱門搜尋依次數排序
+    db["search_stats"].create_index([("count", -1)])
+    # 用戶集合索引
+    users.create_index("username", unique=True)
+    print("✅ 資料庫索引建立完成")
 
 class User(UserMixin):
     def __init__(self, username):
@@ -131,12 +168,16 @@ class User(UserMixin):
         return check_password_hash(user_data['password'], password)
 
 
+_facet_snapshot = {"version": None, "value": None}
+_facet_snapshot_lock = threading.Lock()
+
+
 class Campsite:
     @staticmethod
     @cached(timeout=600)  # 快取10分鐘
     def get_all() -> List[Dict[str, Any]]:
         """獲取所有營地"""
-        return list(collection.find())
+        return list(collection.find({}, CAMPSITE_PROJECTION))
 
     @staticmethod
     @cached(timeout=1800)  # 快取30分鐘
@@ -145,7 +186,7 @@ class Campsite:
         skip = (page - 1) * per_page
         
         # 使用 MongoDB 的分頁查詢
-        campsites = list(collection.find().skip(skip).limit(per_page))
+        campsites = list(collection.find({}, CAMPSITE_PROJECTION).skip(skip).limit(per_page))
         total = collection.count_documents({})
         
         return {
@@ -160,28 +201,52 @@ class Campsite:
     @cached(timeout=1800)  # 快取30分鐘
     def get_by_id(id) -> Dict[str, Any]:
         """根據ID獲取營地"""
-        return collection.find_one({"_id": id})
+        return collection.find_one({"_id": id}, CAMPSITE_PROJECTION)
 
     @staticmethod
     @cached(timeout=1800)  # 快取30分鐘
     def get_by_name(name: str) -> Dict[str, Any]:
         """根據名稱獲取營地"""
-        return collection.find_one({"name": name})
+        return collection.find_one({"name": name}, CAMPSITE_PROJECTION)
 
     @staticmethod
     def create(data: Dict[str, Any]) -> None:
         """創建新的營地記錄"""
-        result = collection.insert_one(data)
+        result = collection.insert_one(dict(
+            data,
+            updated_at=datetime.now(timezone.utc),
+            signal_strength=normalize_carriers(data.get("signal_strength")),
+            search_tokens=document_tokens(data),
+            **geo_fields(data),
+            **classify_location(data.get("location")),
+        ))
         # 清除相關快取
         cache.clear()
+        notify_campsite_changed(result.inserted_id, bump_data_version())
         return result
 
     @staticmethod
     def update(id, data: Dict[str, Any]) -> None:
         """更新營地資訊"""
-        result = collection.update_one({"_id": id}, {"$set": data})
+        if "image_urls" in data:
+            # 圖片變更後移除舊縮圖，讓 python thumbnails.py 重新產生
+            collection.update_one(
+                {"_id": id, "image_urls": {"$ne": data["image_urls"]}}, {"$unset": {"thumbnails": ""}}
+            )
+        result = collection.update_one(
+            {"_id": id},
+            {"$set": dict(
+                data,
+                updated_at=datetime.now(timezone.utc),
+                signal_strength=normalize_carriers(data.get("signal_strength")),
+                search_tokens=document_tokens(data),
+                **geo_fields(data),
+                **classify_location(data.get("location")),
+            )},
+        )
         # 清除相關快取
         cache.clear()
+        notify_campsite_changed(id, bump_data_version())
         return result
 
     @staticmethod
@@ -190,210 +255,133 @@ class Campsite:
         result = collection.delete_one({"_id": id})
         # 清除相關快取
         cache.clear()
+        notify_campsite_changed(id, bump_data_version())
         return result
 
+    @staticmethod
+    def set_thumbnails(id, thumbnails: List[Dict[str, Any]]) -> None:
+        """寫入營地的縮圖資訊（由縮圖產生流程統一清除快取）"""
+        return collection.update_one({"_id": id}, {"$set": {"thumbnails": thumbnails}})
+
+    @staticmethod
+    def get_without_thumbnails() -> List[Dict[str, Any]]:
+        """獲取尚未產生縮圖的營地"""
+        return list(collection.find({"thumbnails": {"$exists": False}}, {"image_urls": 1}))
+
     @staticmethod
     def get_total_count() -> int:
         """獲取營地總數"""
         return collection.count_documents({})
 
-
     @staticmethod
-    @cached(timeout=300)  # 快取5分鐘
-    def search_by_keywords(keywords: str) -> List[Dict[str, Any]]:
-        """根據關鍵字搜索營地"""
-        if not keywords:
-            return []
+    def get_facet_fields() -> List[Dict[str, Any]]:
+        """獲取計算篩選計數所需的欄位（唯讀）
+
+        篩選索引、欄位索引、拼字校正與搜尋建議在同一資料版本共用一份快照，
+        資料變更後只掃描一次集合
+        """
+        from facets import FACET_PROJECTION
+
+        version = get_data_version()
+        if _facet_snapshot["version"] != version:
+            with _facet_snapshot_lock:
+                if _facet_snapshot["version"] != version:
+                    _facet_snapshot["value"] = list(collection.find({}, FACET_PROJECTION))
+                    _facet_snapshot["version"] = version
+        return _facet_snapshot["value"]
 
-        # 將關鍵字分割並建立搜索條件
-        keyword_list = keywords.split()
-        search_conditions = []
-        altitude_filter = None
-        pet_filter = None
-        signal_filter = None
-        parking_filter = None
-        region_filter = None
-
-        # 定義各區域包含的城市
-        region_cities = {
-            "北部": ["臺北", "台北", "新北", "基隆", "新竹", "桃園", "宜蘭"],
-            "中部": ["臺中", "台中", "苗栗", "彰化", "南投", "雲林"],
-            "南部": ["高雄", "臺南", "台南", "嘉義", "屏東", "澎湖"],
-            "東部": ["花蓮", "臺東", "台東"]
-        }
+    @staticmethod
+    def iter_sitemap_entries(skip: int = 0, limit: int = 0):
+        """依 _id 順序逐筆取得 (_id, updated_at)，有 (_id, updated_at) 索引時只掃描索引"""
+        return (
+            collection.find({}, {"updated_at": 1})
+            .sort("_id", 1)
+            .skip(skip)
+            .limit(limit)
+        )
 
-        # 定義通訊服務對應關係
-        signal_keywords = {
-            "中華電信有訊號": ["中華", "中華電信"],
-            "中華電信": ["中華", "中華電信"],
-            "遠傳有訊號": ["遠傳", "遠傳電信"],
-            "遠傳": ["遠傳", "遠傳電信"],
-            "台哥大有訊號": ["台哥大", "台哥大電信"],
-            "台哥大": ["台哥大", "台哥大電信"],
-            "亞太有訊號": ["亞太", "亞太電信"],
-            "亞太": ["亞太", "亞太電信"],
-            "WIFI": ["WIFI", "有網路", "wifi"],
-            "wifi": ["WIFI", "有網路", "wifi"],
-            "有wifi": ["WIFI", "有網路", "wifi"],
-            "有WIFI": ["WIFI", "有網路", "wifi"],
-            "無資訊": ["無資訊"]
-        }
 
-        # 定義停車方式對應關係
-        parking_keywords = {
-            "車停營位旁": ["車邊", "營位旁", "車停營位旁", "車停帳邊"],
-            "集中停車": ["集中停車", "集中", "停車場","可下裝備後，集中停車"]
-        }
+    @staticmethod
+    @cached(timeout=300)  # 快取5分鐘
+    def nearest(lat: float, lng: float, limit: int = 10) -> List[Dict[str, Any]]:
+        """距離指定座標最近的營地，依距離排序，distance 欄位為公尺"""
+        try:
+            return list(collection.aggregate(Campsite.nearest_pipeline(lat, lng, limit)))
+        except OperationFailure as e:
+            # 尚未執行 migrations.py 建立 2dsphere 索引時，改為逐筆計算距離
+            print(f"⚠️ $geoNear 查詢失敗，改為逐筆計算距離: {e}")
+            campsites = list(collection.find({"geo": {"$ne": None}}, CAMPSITE_PROJECTION))
+            for campsite in campsites:
+                lng_, lat_ = campsite["geo"]["coordinates"]
+                campsite["distance"] = distance_meters(lat, lng, lat_, lng_)
+            return sorted(campsites, key=lambda campsite: campsite["distance"])[:limit]
 
-        for keyword in keyword_list:
-            # 處理區域關鍵字
-            if keyword in region_cities:
-                city_patterns = [f".*{city}.*" for city in region_cities[keyword]]
-                region_filter = {
-                    "location": {
-                        "$regex": f"({'|'.join(city_patterns)})",
-                        "$options": "i"
-                    }
-                }
-                continue
-            # 處理海拔相關的關鍵字
-            elif keyword in ["海拔高", "高海拔"]:
-                altitude_filter = {
-                    "$or": [
-                        {"altitude": {"$gt": 1000}},  # 超過1000公尺視為高海拔
-                        {"name": {"$regex": ".*高海拔.*", "$options": "i"}},
-                        {"description": {"$regex": ".*高海拔.*", "$options": "i"}}
-                    ]
-                }
-                continue
-            elif keyword in ["海拔低", "低海拔"]:
-                altitude_filter = {
-                    "$or": [
-                        {"altitude": {"$lt": 1000}},  # 低於1000公尺視為低海拔
-                        {"name": {"$regex": ".*低海拔.*", "$options": "i"}},
-                        {"description": {"$regex": ".*低海拔.*", "$options": "i"}}
-                    ]
-                }
-                continue
-            # 處理寵物相關的關鍵字
-            elif keyword in ["可帶寵物", "寵物可", "可攜帶寵物", "可寵物"]:
-                pet_filter = {
-                    "$or": [
-                        {"pets": "自搭帳可帶寵物"},
-                        {"description": {"$regex": ".*可帶寵物.*", "$options": "i"}}
-                    ]
-                }
-                continue
-            elif keyword in ["不可帶寵物", "寵物不可", "不可攜帶寵物", "不可寵物"]:
-                pet_filter = {
-                    "$or": [
-                        {"pets": "全區不可帶寵物"},
-                        {"description": {"$regex": ".*不可帶寵物.*", "$options": "i"}}
-                    ]
+    @staticmethod
+    def nearest_pipeline(lat: float, lng: float, limit: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "$geoNear": {
+                    "near": {"type": "Point", "coordinates": [lng, lat]},
+                    "distanceField": "distance",
+                    "key": "geo",
+                    "spherical": True,
                 }
-                continue
-            # 處理通訊相關的關鍵字
-            signal_match = False
-            for signal_type, keywords in signal_keywords.items():
-                if keyword in keywords:
-                    # 使用正則表達式來匹配逗號分隔的字串中的值
-                    signal_filter = {
-                        "signal_strength": {
-                            "$regex": f".*{signal_type}.*",
-                            "$options": "i"
-                        }
-                    }
-                    signal_match = True
-                    break
-            if signal_match:
-                continue
-            # 處理停車相關的關鍵字
-            parking_match = False
-            for parking_type, keywords in parking_keywords.items():
-                if keyword in keywords:
-                    parking_filter = {
-                        "$or": [
-                            {"parking": parking_type},
-                            {"parking": {"$regex": f".*{keyword}.*", "$options": "i"}},
-                            {"description": {"$regex": f".*{keyword}.*", "$options": "i"}}
-                        ]
-                    }
-                    parking_match = True
-                    break
-            if parking_match:
-                continue
-
-            regex = re.compile(keyword, re.IGNORECASE)
-            condition = {
-                "$or": [
-                    {"name": regex},
-                    {"location": regex},
-                    {"features": regex},
-                    {"altitude": regex},
-                    {"WC": regex},
-                    {"facilities": regex},
-                    {"sideservice": regex},
-                ]
-            }
-            search_conditions.append(condition)
-
-        # 建立基本查詢條件
-        if len(search_conditions) > 1:
-            query = {"$and": search_conditions}
-        elif len(search_conditions) == 1:
-            query = search_conditions[0]
-        else:
-            query = {}
+            },
+            {"$limit": limit},
+            {"$project": CAMPSITE_PROJECTION},
+        ]
 
-        # 添加區域過濾條件
-        if region_filter:
-            if query:
-                query = {"$and": [query, region_filter]}
-            else:
-                query = region_filter
+    @staticmethod
+    def search_by_keywords(keywords: str) -> List[Dict[str, Any]]:
+        """根據關鍵字搜索營地（順序、寫法不同但條件相同的搜尋共用快取）"""
+        plan = plan_key(keywords) if keywords else ""
+        if not plan:
+            return []
+        return Campsite.search_plan(plan)
 
-        # 添加寵物過濾條件
-        if pet_filter:
-            if query:
-                query = {"$and": [query, pet_filter]}
-            else:
-                query = pet_filter
+    @staticmethod
+    def search_query(filters: Dict[str, Any], text_keywords: List[str], store=None) -> Dict[str, Any]:
+        """搜尋條件對應的 MongoDB 查詢；有欄位索引時結構化條件改為 _id 清單"""
+        search_conditions = [keyword_condition(keyword) for keyword in text_keywords]
+        if store is not None:
+            # 結構化條件以記憶體中的欄位陣列計算，資料庫只取回符合的營地
+            search_conditions.append({"_id": {"$in": store.filter(**filters)}})
+        else:
+            search_conditions.extend(mongo_conditions(filters))
 
-        # 添加通訊過濾條件
-        if signal_filter:
-            if query:
-                query = {"$and": [query, signal_filter]}
-            else:
-                query = signal_filter
+        if len(search_conditions) > 1:
+            return {"$and": search_conditions}
+        if len(search_conditions) == 1:
+            return search_conditions[0]
+        return {}
 
-        # 添加停車過濾條件
-        if parking_filter:
-            if query:
-                query = {"$and": [query, parking_filter]}
-            else:
-                query = parking_filter
-
-        # 獲取初步結果
-        results = list(collection.find(query))
-
-        # 處理海拔過濾
-        if altitude_filter is not None:
-            filtered_results = []
-            for result in results:
-                try:
-                    # 從海拔字串中提取數字
-                    altitude_str = result.get("altitude", "0")
-                    altitude_match = re.search(r'(\d+)', altitude_str)
-                    if altitude_match:
-                        altitude = int(altitude_match.group(1))
-                        # 根據高低海拔條件過濾
-                        if ("海拔高" in keyword_list or "高海拔" in keyword_list) and altitude >= 1000:
-                            filtered_results.append(result)
-                        elif ("海拔低" in keyword_list or "低海拔" in keyword_list) and altitude < 1000:
-                            filtered_results.append(result)
-                except (ValueError, TypeError):
-                    continue
-            results = filtered_results
+    @staticmethod
+    @cached(timeout=300)  # 快取5分鐘
+    def search_plan(keywords: str) -> List[Dict[str, Any]]:
+        """以正規化後的搜尋條件查詢營地"""
+        # 區域、海拔、寵物、通訊、停車為結構化條件，其餘關鍵字比對文字欄位
+        filters, text_keywords = parse_query(keywords)
+
+        from attribute_store import get_attribute_store
+        store = get_attribute_store() if filters else None
+        query = Campsite.search_query(filters, text_keywords, store)
+
+        # 獲取結果
+        results = list(collection.find(query, CAMPSITE_PROJECTION))
+
+        # 資料庫查詢路徑的海拔過濾
+        if store is None and "altitude" in filters:
+            results = [
+                result for result in results
+                if altitude_band(result.get("altitude")) == filters["altitude"]
+            ]
+
+        # 沒有結果時嘗試校正拼錯的關鍵字再搜尋一次
+        if not results:
+            corrected = correct_query(keywords)
+            if corrected:
+                print(f"🔤 關鍵字校正: {keywords} -> {corrected}")
+                return Campsite.search_by_keywords(corrected)
 
         # 確保每個結果都包含其獨特的圖片URLs
         for result in results:
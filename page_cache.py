@@ -0,0 +1,127 @@
+"""
+頁面與片段快取
+匿名訪客的頁面以（查詢參數, 資料版本, 壓縮格式）為鍵快取已壓縮的 HTML；
+每個營地卡片的 HTML 另外快取，未命中的頁面與管理員頁面也能重用
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Dict, Hashable, Optional
+
+from flask import Response, current_app, request
+from flask_login import current_user
+from markupsafe import Markup
+
+from http_cache import encode_body, is_anonymous_request, negotiate_encoding, render_version
+from models import get_data_version
+
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+
+
+class ByteLRUCache:
+    """以總位元組數為上限的 LRU 快取
+
+    鍵包含資料版本，資料變更後舊項目不再被讀取，隨 LRU 自然淘汰。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old:
+                self.total_bytes -= old[1]
+            self._items[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+page_cache = ByteLRUCache(PAGE_CACHE_MAX_BYTES)
+fragment_cache = ByteLRUCache(FRAGMENT_CACHE_MAX_BYTES)
+
+
+def cached_page(params_func):
+    """快取匿名訪客的整頁輸出，params_func 回傳正規化後的查詢參數"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or not is_anonymous_request():
+                return view(*args, **kwargs)
+
+            requested = negotiate_encoding()
+            key = (request.endpoint, render_version(), get_data_version(), params_func(), requested)
+            entry = page_cache.get(key)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body, encoding = encode_body(response.get_data(), requested)
+                entry = (body, encoding, response.mimetype)
+                page_cache.set(key, entry, len(body))
+
+            body, encoding, mimetype = entry
+            response = Response(body, mimetype=mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+        return wrapper
+    return decorator
+
+
+def render_campsite_card(campsite: Dict[str, Any]) -> Markup:
+    """渲染營地卡片，管理員版本多了編輯與刪除按鈕，兩者分開快取"""
+    admin = current_user.is_authenticated
+    key = (render_version(), get_data_version(), str(campsite["_id"]), admin)
+    html = fragment_cache.get(key)
+    if html is None:
+        template = current_app.jinja_env.get_template("_campsite_card.html")
+        html = template.render(campsite=campsite, admin=admin)
+        fragment_cache.set(key, html, len(html.encode("utf-8")))
+    return Markup(html)
+
+
+def clear_page_caches():
+    page_cache.clear()
+    fragment_cache.clear()
+
+
+def init_page_cache(app):
+    app.jinja_env.globals["render_campsite_card"] = render_campsite_card
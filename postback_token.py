@@ -0,0 +1,62 @@
+"""
+搜尋流程的 postback 資料編碼
+將已選擇的條件壓縮並簽章後放入下一步按鈕的 postback data，
+讓任何 worker 都能在不保存用戶狀態的情況下處理任一步驟
+"""
+
+import hmac
+import base64
+import hashlib
+from typing import Optional, Sequence, Tuple
+
+# LINE postback data 長度上限
+MAX_POSTBACK_DATA_LENGTH = 300
+
+STEP_PREFIX = "w"    # 仍在選擇條件
+SEARCH_PREFIX = "s"  # 條件已完整，開始搜尋
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_SIGNATURE_BYTES = 8
+
+
+class WizardTokenCodec:
+    """以 HMAC 簽章的選項索引編碼器
+
+    每個已選條件以其選項索引的單一 base36 字元表示，
+    例如「中部 / 台中 / 高海拔」編碼後為 ``w100.<簽章>``。
+    """
+
+    def __init__(self, secret: str):
+        self._key = secret.encode("utf-8")
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:_SIGNATURE_BYTES]).rstrip(b"=").decode("ascii")
+
+    def encode(self, selections: Sequence[int], final: bool = False) -> str:
+        """將選項索引編碼為 postback data"""
+        payload = (SEARCH_PREFIX if final else STEP_PREFIX) + "".join(
+            _DIGITS[index] for index in selections
+        )
+        data = f"{payload}.{self._sign(payload)}"
+        if len(data) > MAX_POSTBACK_DATA_LENGTH:
+            raise ValueError("postback data 超過 LINE 長度限制")
+        return data
+
+    def decode(self, data: str) -> Optional[Tuple[Tuple[int, ...], bool]]:
+        """解析 postback data，格式或簽章不符時回傳 None"""
+        payload, sep, signature = data.partition(".")
+        if not sep or not payload or payload[0] not in (STEP_PREFIX, SEARCH_PREFIX):
+            return None
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return None
+        try:
+            selections = tuple(_DIGITS.index(char) for char in payload[1:])
+        except ValueError:
+            return None
+        return selections, payload[0] == SEARCH_PREFIX
+
+    @staticmethod
+    def is_token(data: str) -> bool:
+        """判斷 postback data 是否為編碼後的條件（而非 JSON）"""
+        return bool(data) and data[0] in (STEP_PREFIX, SEARCH_PREFIX)
@@ -0,0 +1,212 @@
+"""
+搜尋關鍵字的正規化與拼字校正
+異體字（臺／台）、全形與大小寫統一後，以同義詞表對應到標準關鍵字；
+搜尋沒有結果時，以 BK-tree 在詞彙中找編輯距離最近的詞重新搜尋
+"""
+
+import re
+import logging
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from geography import COUNTIES, REGION_CITIES, city_variants
+from search_filters import (
+    ALTITUDE_KEYWORDS,
+    PARKING_KEYWORDS,
+    PET_KEYWORDS,
+    REGION_KEYWORD_CITIES,
+    SIGNAL_KEYWORDS,
+    parse_search_keywords,
+)
+
+logger = logging.getLogger(__name__)
+
+# 異體字統一為常用寫法
+VARIANT_CHARACTERS = {"臺": "台", "裏": "裡", "峯": "峰", "温": "溫", "羣": "群", "綫": "線"}
+_VARIANT_TABLE = str.maketrans(VARIANT_CHARACTERS)
+# 常用寫法對應的所有寫法，用於組成 regex 的字元集合
+_CHARACTER_CLASSES = {}
+for _variant, _common in VARIANT_CHARACTERS.items():
+    _CHARACTER_CLASSES.setdefault(_common, [_common]).append(_variant)
+
+
+def fold(text: str) -> str:
+    """全形轉半形、英文轉小寫、異體字轉常用字"""
+    return unicodedata.normalize("NFKC", text).lower().translate(_VARIANT_TABLE)
+
+
+def variant_pattern(keyword: str) -> str:
+    """關鍵字的 regex（已跳脫特殊字元），異體字兩種寫法都能符合"""
+    parts = []
+    for char in fold(keyword):
+        variants = _CHARACTER_CLASSES.get(char)
+        parts.append(f"[{''.join(variants)}]" if variants else re.escape(char))
+    return "".join(parts)
+
+
+def _build_synonyms() -> Dict[str, str]:
+    """正規化後的寫法 -> 結構化條件使用的標準關鍵字"""
+    synonyms = {}
+
+    def add(word, canonical):
+        synonyms.setdefault(fold(word), canonical)
+
+    for region in REGION_KEYWORD_CITIES:
+        add(region, region)
+    for groups in (ALTITUDE_KEYWORDS, PET_KEYWORDS):
+        for word in groups:
+            add(word, word)
+    for name, words in list(SIGNAL_KEYWORDS.items()) + list(PARKING_KEYWORDS.items()):
+        for word in words:
+            add(word, word)
+        add(name, words[0])
+    for cities in REGION_CITIES.values():
+        for city in cities:
+            for variant in city_variants(city):
+                add(variant, city)
+    return synonyms
+
+
+SYNONYMS = _build_synonyms()
+
+
+def normalize_keywords(keywords: List[str]) -> List[str]:
+    """正規化每個關鍵字，同義的寫法換成標準關鍵字"""
+    normalized = []
+    for keyword in keywords:
+        folded = fold(keyword)
+        if folded:
+            normalized.append(SYNONYMS.get(folded, folded))
+    return normalized
+
+
+def parse_query(query: str) -> Tuple[Dict[str, Any], List[str]]:
+    """正規化後拆分為結構化條件與一般關鍵字"""
+    return parse_search_keywords(normalize_keywords(query.split()))
+
+
+FILTER_ORDER = ("region", "county", "altitude", "pets", "signal", "parking")
+
+
+def plan_key(query: str) -> str:
+    """搜尋條件的標準寫法：結構化條件依固定順序，一般關鍵字依字母排序
+
+    結果本身也是可以直接搜尋的關鍵字字串
+    """
+    filters, keywords = parse_query(query)
+    parts = []
+    for name in FILTER_ORDER:
+        if name in filters:
+            value = filters[name]
+            parts.append(value[1] if name == "parking" else value)
+    parts.extend(sorted(set(keywords)))
+    return " ".join(parts)
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """以編輯距離為度量的 BK-tree，查詢時只走訪距離可能符合的子樹"""
+
+    def __init__(self, words=()):
+        self.root = None
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        if self.root is None:
+            self.root = (word, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        """距離不超過 max_distance 的詞，依 (距離, 詞) 排序"""
+        if self.root is None:
+            return []
+        results = []
+        stack = [self.root]
+        while stack:
+            candidate, children = stack.pop()
+            distance = edit_distance(word, candidate)
+            if distance <= max_distance:
+                results.append((distance, candidate))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results)
+
+
+def max_typo_distance(keyword: str) -> int:
+    """可校正的編輯距離；二字以下的詞改一個字就是另一個詞，不校正"""
+    if len(keyword) < 3:
+        return 0
+    return 1 if len(keyword) <= 5 else 2
+
+
+_spelling = {"version": None, "value": None}
+_spelling_lock = threading.Lock()
+
+
+def get_spelling_index() -> BKTree:
+    """同義詞、縣市與營地名稱組成的詞彙，資料變更後重建"""
+    from models import Campsite, get_data_version
+
+    version = get_data_version()
+    if _spelling["version"] != version:
+        with _spelling_lock:
+            if _spelling["version"] != version:
+                words = set(SYNONYMS) | {fold(county) for county in COUNTIES}
+                words.update(
+                    fold(campsite["name"])
+                    for campsite in Campsite.get_facet_fields()
+                    if campsite.get("name")
+                )
+                _spelling["value"] = BKTree(sorted(words))
+                _spelling["version"] = version
+                logger.info(f"拼字校正詞彙已重建: {_spelling['value'].size} 個詞")
+    return _spelling["value"]
+
+
+def correct_query(query: str) -> Optional[str]:
+    """將拼錯的關鍵字換成詞彙中唯一最接近的詞，沒有可校正的詞時回傳 None"""
+    keywords = normalize_keywords(query.split())
+    tree = get_spelling_index()
+    corrected = []
+    changed = False
+    for keyword in keywords:
+        replacement = keyword
+        max_distance = max_typo_distance(keyword)
+        if max_distance and fold(keyword) not in SYNONYMS:
+            matches = tree.search(fold(keyword), max_distance)
+            if matches and matches[0][0] > 0:
+                # 最近的詞不只一個時無法判斷使用者的意思，保留原字
+                if len(matches) == 1 or matches[1][0] > matches[0][0]:
+                    replacement = SYNONYMS.get(matches[0][1], matches[0][1])
+        changed = changed or replacement != keyword
+        corrected.append(replacement)
+    return " ".join(corrected) if changed else None
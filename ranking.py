@@ -0,0 +1,121 @@
+"""
+搜尋結果相關性排序
+以 BM25 對名稱、特色、設施、地址評分（各欄位有不同權重，名稱完全相符另外加分），
+只挑出需要顯示的前 k 筆排序，不對整個結果做完整排序
+"""
+
+import math
+import heapq
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # 未安裝 NumPy 時改用 heapq
+    np = None
+
+from query_normalizer import fold, parse_query
+
+# 評分欄位與權重
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "features": 1.5,
+    "facilities": 1.0,
+    "location": 1.0,
+}
+K1 = 1.2
+B = 0.75
+EXACT_NAME_BOOST = 10.0   # 名稱與關鍵字完全相同
+NAME_PREFIX_BOOST = 3.0   # 名稱以關鍵字開頭
+
+
+def _text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(item) for item in value)
+    return str(value) if value else ""
+
+
+def terms_for(keyword: str) -> List[str]:
+    """中文沒有空白分詞，以相鄰兩字（bigram）為詞；單字關鍵字直接使用"""
+    keyword = fold(keyword)
+    if len(keyword) < 2:
+        return [keyword] if keyword else []
+    return [keyword[i:i + 2] for i in range(len(keyword) - 1)]
+
+
+def score(campsites: List[Dict[str, Any]], keywords: List[str]) -> List[float]:
+    """計算每個營地的 BM25F 分數，語料統計以本次的候選結果為範圍"""
+    count = len(campsites)
+    texts = {
+        field: [fold(_text(campsite.get(field))) for campsite in campsites]
+        for field in FIELD_WEIGHTS
+    }
+    lengths = {
+        field: [max(len(text) - 1, 1) for text in values] for field, values in texts.items()
+    }
+    average = {field: (sum(values) / count) or 1 for field, values in lengths.items()}
+
+    scores = [0.0] * count
+    for term in {term for keyword in keywords for term in terms_for(keyword)}:
+        # 各欄位依長度正規化後加權合併詞頻
+        weighted_tf = [0.0] * count
+        for field, weight in FIELD_WEIGHTS.items():
+            for i, text in enumerate(texts[field]):
+                tf = text.count(term)
+                if tf:
+                    norm = 1 - B + B * lengths[field][i] / average[field]
+                    weighted_tf[i] += weight * tf / norm
+        df = sum(1 for tf in weighted_tf if tf)
+        if not df:
+            continue
+        idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+        for i, tf in enumerate(weighted_tf):
+            if tf:
+                scores[i] += idf * tf * (K1 + 1) / (tf + K1)
+
+    for i, campsite in enumerate(campsites):
+        name = fold(_text(campsite.get("name")))
+        for keyword in keywords:
+            keyword = fold(keyword)
+            if name == keyword:
+                scores[i] += EXACT_NAME_BOOST
+            elif name.startswith(keyword):
+                scores[i] += NAME_PREFIX_BOOST
+    return scores
+
+
+def _top_positions(scores: List[float], k: int) -> List[int]:
+    """分數最高的 k 筆位置（分數相同時保留原順序）"""
+    if np is not None:
+        values = np.asarray(scores)
+        if k < len(values):
+            # 第 k 高的分數；同分時取位置較前者，不同頁的 k 選出的集合才會一致
+            kth = np.partition(values, len(values) - k)[len(values) - k]
+            above = np.flatnonzero(values > kth)
+            tied = np.flatnonzero(values == kth)[:k - len(above)]
+            candidates = np.sort(np.concatenate([above, tied]))
+        else:
+            candidates = np.arange(len(values))
+        order = np.argsort(-values[candidates], kind="stable")
+        return candidates[order].tolist()
+    return heapq.nsmallest(k, range(len(scores)), key=lambda i: (-scores[i], i))
+
+
+def rank(campsites: List[Dict[str, Any]], query: str, limit: Optional[int] = None):
+    """依相關性重新排列搜尋結果
+
+    只有前 limit 筆依分數排序，其餘維持原順序接在後面，
+    分頁時傳入「頁碼 × 每頁筆數」即可，總數不變。
+    沒有一般關鍵字（只有地區、海拔等條件）時不改變順序。
+    """
+    _, keywords = parse_query(query)
+    if not keywords or len(campsites) < 2:
+        return campsites
+
+    limit = len(campsites) if limit is None else max(0, min(limit, len(campsites)))
+    if not limit:
+        return campsites
+    top = _top_positions(score(campsites, keywords), limit)
+    chosen = set(top)
+    return [campsites[i] for i in top] + [
+        campsite for i, campsite in enumerate(campsites) if i not in chosen
+    ]
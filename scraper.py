@@ -4,7 +4,9 @@ import logging
 import requests
 import json
 import time
+from carriers import normalize_carriers
 from models import Campsite
+from thumbnails import generate_missing_thumbnails
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -334,10 +336,8 @@ def scrape_campsite():
 
         # 無線通訊資訊
         signal_tag = soup.select_one(".classify .title:contains('無線通訊') + ul")
-        signal = (
-            ", ".join([li.text.strip() for li in signal_tag.select("li")])
-            if signal_tag
-            else "未知"
+        signal = normalize_carriers(
+            [li.text.strip() for li in signal_tag.select("li")] if signal_tag else []
         )
 
         # 取得特定欄位
@@ -388,5 +388,7 @@ def save_campsite():
 
 
 if __name__ == "__main__":
-    # 當直接執行此檔案時，執行爬蟲並儲存資料
+    # 當直接執行此檔案時，執行爬蟲並儲存資料，再為新營地產生縮圖
+    # （縮圖以多進程產生，不在網頁請求中執行）
     save_campsite()
+    generate_missing_thumbnails()
@@ -0,0 +1,188 @@
+"""
+關鍵字搜尋的結構化條件
+區域、海拔、寵物、通訊與停車關鍵字的對照與判斷規則，
+供資料庫查詢與記憶體欄位索引共用
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from geography import CITY_COUNTIES, COUNTIES, REGION_CITIES, city_variants, county_members
+
+# 各區域包含的城市（含「臺」的寫法）
+REGION_KEYWORD_CITIES = {
+    region: [variant for city in cities for variant in city_variants(city)]
+    for region, cities in REGION_CITIES.items()
+}
+
+# 縣市條件：完整縣市名稱或 LINE 搜尋流程的縣市（如「新竹」涵蓋新竹市與新竹縣）
+COUNTY_KEYWORDS = set(COUNTIES) | set(CITY_COUNTIES)
+
+HIGH_ALTITUDE = 1000  # 公尺，超過視為高海拔
+ALTITUDE_KEYWORDS = {
+    "海拔高": "高海拔",
+    "高海拔": "高海拔",
+    "海拔低": "低海拔",
+    "低海拔": "低海拔",
+}
+
+PET_KEYWORDS = {
+    "可帶寵物": "可帶寵物",
+    "寵物可": "可帶寵物",
+    "可攜帶寵物": "可帶寵物",
+    "可寵物": "可帶寵物",
+    "不可帶寵物": "不可帶寵物",
+    "寵物不可": "不可帶寵物",
+    "不可攜帶寵物": "不可帶寵物",
+    "不可寵物": "不可帶寵物",
+}
+# 寵物條件對應的 pets 欄位值
+PET_VALUES = {"可帶寵物": "自搭帳可帶寵物", "不可帶寵物": "全區不可帶寵物"}
+
+# 通訊條件：電信業者代碼（signal_strength 陣列的值）與對應的關鍵字
+SIGNAL_KEYWORDS = {
+    "中華電信": ["中華", "中華電信", "中華電信有訊號"],
+    "遠傳": ["遠傳", "遠傳電信", "遠傳有訊號"],
+    "台哥大": ["台哥大", "台哥大電信", "台哥大有訊號"],
+    "亞太": ["亞太", "亞太電信", "亞太有訊號"],
+    "WIFI": ["WIFI", "有網路", "wifi", "有wifi", "有WIFI"],
+    "無資訊": ["無資訊"],
+}
+
+# 停車方式對應關係
+PARKING_KEYWORDS = {
+    "車停營位旁": ["車邊", "營位旁", "車停營位旁", "車停帳邊"],
+    "集中停車": ["集中停車", "集中", "停車場", "可下裝備後，集中停車"],
+}
+
+
+def parse_search_keywords(keyword_list: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+    """將關鍵字分為結構化條件與一般關鍵字，同類條件以最後出現的為準
+
+    結構化條件的格式：
+    region: 區域名稱、county: 縣市關鍵字、altitude: 高海拔/低海拔、pets: 可帶寵物/不可帶寵物、
+    signal: 電信業者代碼、parking: (停車方式, 原始關鍵字)
+    """
+    filters = {}
+    text_keywords = []
+    for keyword in keyword_list:
+        if keyword in REGION_KEYWORD_CITIES:
+            filters["region"] = keyword
+        elif keyword in COUNTY_KEYWORDS:
+            filters["county"] = keyword
+        elif keyword in ALTITUDE_KEYWORDS:
+            filters["altitude"] = ALTITUDE_KEYWORDS[keyword]
+        elif keyword in PET_KEYWORDS:
+            filters["pets"] = PET_KEYWORDS[keyword]
+        else:
+            signal_type = next(
+                (name for name, words in SIGNAL_KEYWORDS.items() if keyword in words), None
+            )
+            parking_type = next(
+                (name for name, words in PARKING_KEYWORDS.items() if keyword in words), None
+            )
+            if signal_type:
+                filters["signal"] = signal_type
+            elif parking_type:
+                filters["parking"] = (parking_type, keyword)
+            else:
+                text_keywords.append(keyword)
+    return filters, text_keywords
+
+
+def field_text(value) -> str:
+    """欄位值轉為文字（表單存的清單以逗號連接）"""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    return str(value) if value else ""
+
+
+def pet_options(campsite: Dict[str, Any]) -> List[str]:
+    """營地符合的寵物條件：pets 欄位值或描述中提到"""
+    description = field_text(campsite.get("description")).lower()
+    return [
+        option for option, pet_value in PET_VALUES.items()
+        if campsite.get("pets") == pet_value or option in description
+    ]
+
+
+def parking_matches(campsite: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """營地符合的停車條件 (停車方式, 關鍵字)：parking 欄位值，或停車方式、描述中出現關鍵字"""
+    parking = field_text(campsite.get("parking"))
+    description = field_text(campsite.get("description")).lower()
+    return [
+        (parking_type, keyword)
+        for parking_type, keywords in PARKING_KEYWORDS.items()
+        for keyword in keywords
+        if parking == parking_type or keyword.lower() in parking.lower() or keyword.lower() in description
+    ]
+
+
+def altitude_value(altitude) -> Optional[int]:
+    """從海拔字串中取出第一個數字，沒有數字時回傳 None"""
+    if altitude is None:
+        return None
+    match = re.search(r"(\d+)", str(altitude))
+    return int(match.group(1)) if match else None
+
+
+def altitude_band(altitude) -> Optional[str]:
+    value = altitude_value(altitude)
+    if value is None:
+        return None
+    return "高海拔" if value >= HIGH_ALTITUDE else "低海拔"
+
+
+def mongo_conditions(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """結構化條件的 MongoDB 查詢（海拔需在取回後以 altitude_band 過濾）
+
+    區域與縣市以寫入時解析的 region、county 欄位查詢；
+    尚未補上欄位的舊資料（欄位為 null）仍以地址比對，通訊資訊同理
+    """
+    conditions = []
+    if "region" in filters:
+        city_patterns = [f".*{city}.*" for city in REGION_KEYWORD_CITIES[filters["region"]]]
+        conditions.append({
+            "$or": [
+                {"region": filters["region"]},
+                {
+                    "region": None,
+                    "location": {"$regex": f"({'|'.join(city_patterns)})", "$options": "i"},
+                },
+            ]
+        })
+    if "county" in filters:
+        counties = county_members(filters["county"])
+        variants = [variant for county in counties for variant in city_variants(county)]
+        conditions.append({
+            "$or": [
+                {"county": {"$in": counties}},
+                {"county": None, "location": {"$regex": f"({'|'.join(variants)})"}},
+            ]
+        })
+    if "pets" in filters:
+        conditions.append({
+            "$or": [
+                {"pets": PET_VALUES[filters["pets"]]},
+                {"description": {"$regex": f".*{filters['pets']}.*", "$options": "i"}},
+            ]
+        })
+    if "signal" in filters:
+        # signal_strength 為代碼陣列（multikey 索引），等值查詢即「包含此業者」；
+        # 尚未轉換的舊資料（字串）仍以業者名稱比對
+        conditions.append({
+            "$or": [
+                {"signal_strength": filters["signal"]},
+                {"signal_strength": {"$type": "string", "$regex": re.escape(filters["signal"]), "$options": "i"}},
+            ]
+        })
+    if "parking" in filters:
+        parking_type, keyword = filters["parking"]
+        conditions.append({
+            "$or": [
+                {"parking": parking_type},
+                {"parking": {"$regex": f".*{keyword}.*", "$options": "i"}},
+                {"description": {"$regex": f".*{keyword}.*", "$options": "i"}},
+            ]
+        })
+    return conditions
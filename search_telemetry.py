@@ -0,0 +1,171 @@
+"""
+熱門搜尋統計
+每次搜尋先正規化為搜尋條件（同樣的條件不論輸入順序、寫法都算同一筆），
+以 Space-Saving 演算法在固定大小的記憶體內統計次數最高的搜尋，
+背景執行緒定期把實際的搜尋次數增量寫入 MongoDB，各 worker 的統計在資料庫合併
+"""
+
+import os
+import heapq
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from query_normalizer import plan_key
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_CAPACITY = int(os.getenv("SEARCH_TELEMETRY_CAPACITY", 500))  # 記憶體內追蹤的搜尋數
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("SEARCH_TELEMETRY_FLUSH_INTERVAL", 60))
+POPULAR_SEARCHES_TTL = 60  # 熱門搜尋清單的快取秒數
+DEFAULT_POPULAR_SEARCHES = ["台中", "高海拔", "可帶寵物", "車停營位旁", "北部"]
+
+class SpaceSaving:
+    """Space-Saving 熱門項目統計
+
+    最多追蹤 capacity 個項目；新項目在已滿時取代次數最少的項目，並繼承其次數
+    （記為誤差上限）。次數大於 總數 / capacity 的項目保證會被保留
+    """
+
+    def __init__(self, capacity: int = TELEMETRY_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+        self._heap: List[Tuple[int, str]] = []  # (次數, 項目)，次數過期的項目延後清除
+
+    def offer(self, item: str, weight: int = 1):
+        self.total += weight
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+        else:
+            minimum, evicted = self._pop_min()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[item] = minimum + weight
+            self.errors[item] = minimum
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[int, str]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """次數最高的 n 個項目：(項目, 次數, 誤差上限)"""
+        items = heapq.nsmallest(n, self.counts.items(), key=lambda entry: (-entry[1], entry[0]))
+        return [(item, count, self.errors[item]) for item, count in items]
+
+
+class SearchTelemetry:
+    """單一 worker 的搜尋統計與定期寫入"""
+
+    def __init__(self, capacity: int = TELEMETRY_CAPACITY,
+                 flush_interval: float = TELEMETRY_FLUSH_INTERVAL):
+        self.sketch = SpaceSaving(capacity)
+        self.flush_interval = flush_interval
+        # 上次寫入後各項目實際被搜尋的次數（不含 Space-Saving 取代時繼承的次數）
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._popular = {"expires": 0.0, "value": None}
+
+    def record(self, query: str):
+        key = plan_key(query or "")
+        if not key:
+            return
+        with self._lock:
+            self.sketch.offer(key)
+            self._pending[key] = self._pending.get(key, 0) + 1
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run, daemon=True)
+                    self._flusher.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """把上次寫入後實際的搜尋次數累加到資料庫，回傳寫入的項目數"""
+        with self._lock:
+            deltas, self._pending = self._pending, {}
+        if not deltas:
+            return 0
+        try:
+            from pymongo import UpdateOne
+            from models import db
+
+            now = datetime.now(timezone.utc)
+            db["search_stats"].bulk_write([
+                UpdateOne({"_id": item}, {"$inc": {"count": delta}, "$set": {"updated_at": now}}, upsert=True)
+                for item, delta in deltas.items()
+            ], ordered=False)
+        except Exception as e:
+            logger.warning(f"寫入搜尋統計失敗: {e}")
+            # 放回待寫入的次數，下次一併重試
+            with self._lock:
+                for item, delta in deltas.items():
+                    self._pending[item] = self._pending.get(item, 0) + delta
+            return 0
+        return len(deltas)
+
+    def popular(self, n: int = 10) -> List[str]:
+        """所有 worker 合計的熱門搜尋；資料庫無法使用時以本 worker 的統計代替"""
+        if time.time() >= self._popular["expires"]:
+            try:
+                from models import db
+
+                value = [
+                    doc["_id"]
+                    for doc in db["search_stats"].find({}, {"_id": 1}).sort("count", -1).limit(max(n, 50))
+                ]
+            except Exception as e:
+                logger.warning(f"讀取搜尋統計失敗: {e}")
+                with self._lock:
+                    value = [item for item, _, _ in self.sketch.top(max(n, 50))]
+            self._popular.update(value=value, expires=time.time() + POPULAR_SEARCHES_TTL)
+        return (self._popular["value"] or DEFAULT_POPULAR_SEARCHES)[:n]
+
+    def stats(self, n: int = 10) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "tracked": len(self.sketch.counts),
+                "capacity": self.sketch.capacity,
+                "total": self.sketch.total,
+                "top": [
+                    {"query": item, "count": count, "error": error}
+                    for item, count, error in self.sketch.top(n)
+                ],
+            }
+
+
+search_telemetry = SearchTelemetry()
+
+
+def record_search(query: str):
+    """記錄一次搜尋（統計失敗不影響搜尋本身）"""
+    try:
+        search_telemetry.record(query)
+    except Exception as e:
+        logger.warning(f"記錄搜尋失敗: {e}")
+
+
+def popular_searches(n: int = 10) -> List[str]:
+    return search_telemetry.popular(n)
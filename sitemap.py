@@ -1,13 +1,96 @@
-from flask import Blueprint, Response
+"""
+Sitemap
+由資料庫串流產生每個營地詳細頁的網址，超過單檔上限時改用 sitemap index 分檔，
+產生結果依資料版本快取
+"""
+
+from xml.sax.saxutils import escape
+
+from flask import Blueprint, Response, abort
+
+from http_cache import conditional_page
+from models import Campsite, get_data_version
+from page_cache import page_cache
+from thumbnails import PUBLIC_BASE_URL
 
 sitemap_bp = Blueprint("sitemap", __name__)
 
+SITEMAP_MAX_URLS = 50000  # sitemaps.org 規範的單檔網址上限
+# 首頁只列在第一個分檔，每個分檔保留一個位置給它
+CAMPSITES_PER_SITEMAP = SITEMAP_MAX_URLS - 1
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def _url_entry(loc: str, lastmod=None) -> str:
+    entry = f"  <url><loc>{escape(loc)}</loc>"
+    if lastmod is not None:
+        entry += f"<lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>"
+    return entry + "</url>\n"
+
+
+def _urlset(skip: int, limit: int, include_home: bool):
+    yield XML_HEADER + f'<urlset xmlns="{XMLNS}">\n'
+    if include_home:
+        yield _url_entry(f"{PUBLIC_BASE_URL}/")
+    for doc in Campsite.iter_sitemap_entries(skip, limit):
+        # 尚未記錄更新時間的舊資料以建立時間代替
+        lastmod = doc.get("updated_at") or doc["_id"].generation_time
+        yield _url_entry(f"{PUBLIC_BASE_URL}/campsite/{doc['_id']}", lastmod)
+    yield "</urlset>\n"
+
+
+def _stream_and_cache(key, parts):
+    """邊串流邊累積內容，完整產生後存入頁面快取"""
+    chunks = []
+    for part in parts:
+        data = part.encode("utf-8")
+        chunks.append(data)
+        yield data
+    body = b"".join(chunks)
+    page_cache.set(key, body, len(body))
+
+
+def _xml_response(key, build):
+    """快取命中時直接回應，否則呼叫 build() 串流產生"""
+    body = page_cache.get(key)
+    if body is None:
+        return Response(_stream_and_cache(key, build()), mimetype="application/xml")
+    return Response(body, mimetype="application/xml")
+
+
+def _sitemap_count() -> int:
+    total = Campsite.get_total_count()
+    return max(1, -(-total // CAMPSITES_PER_SITEMAP))
+
+
+def _sitemap_index(count: int):
+    yield XML_HEADER + f'<sitemapindex xmlns="{XMLNS}">\n'
+    for number in range(1, count + 1):
+        yield f"  <sitemap><loc>{PUBLIC_BASE_URL}/sitemap-{number}.xml</loc></sitemap>\n"
+    yield "</sitemapindex>\n"
+
 
 @sitemap_bp.route("/sitemap.xml")
+@conditional_page
 def sitemap():
-    base_url = "https://camping.ddnsking.com"
-    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    xml += f"  <url><loc>{base_url}/</loc></url>\n"
-    xml += "</urlset>"
-    return Response(xml, mimetype="application/xml")
+    def build():
+        count = _sitemap_count()
+        if count == 1:
+            return _urlset(0, 0, include_home=True)
+        return _sitemap_index(count)
+
+    return _xml_response(("sitemap", get_data_version()), build)
+
+
+@sitemap_bp.route("/sitemap-<int:number>.xml")
+@conditional_page
+def sitemap_part(number):
+    def build():
+        if not 1 <= number <= _sitemap_count():
+            abort(404)
+        return _urlset(
+            (number - 1) * CAMPSITES_PER_SITEMAP, CAMPSITES_PER_SITEMAP, include_home=number == 1
+        )
+
+    return _xml_response(("sitemap", get_data_version(), number), build)
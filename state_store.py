@@ -0,0 +1,161 @@
+"""
+用戶對話狀態儲存
+提供 O(1) 過期清理、容量上限與可插拔的共享後端
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 狀態欄位順序 - 每位用戶只保存一個固定長度的 tuple
+STATE_FIELDS = ("step", "region", "city", "altitude", "pet", "parking")
+
+DEFAULT_TTL = 1800  # 30分鐘未活動即過期
+DEFAULT_MAX_ENTRIES = 10000
+CAPACITY_CHECK_INTERVAL = 30  # 共享後端檢查容量上限的間隔秒數
+
+
+def pack_state(state: Dict[str, Any]) -> Tuple:
+    """將狀態字典壓縮為固定欄位的 tuple"""
+    return tuple(state.get(field) for field in STATE_FIELDS)
+
+
+def unpack_state(values) -> Dict[str, Any]:
+    """將 tuple 還原為狀態字典"""
+    return dict(zip(STATE_FIELDS, values))
+
+
+class LocalStateBackend:
+    """單一進程內的狀態儲存
+
+    所有項目的存活時間相同，因此依最後寫入時間排序的 OrderedDict
+    即為一個 TTL 佇列：最早過期的項目永遠在最前面，過期清理與
+    容量淘汰都只需從前端彈出，不必掃描全部用戶。
+    """
+
+    def __init__(self, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (expires_at, values)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Tuple]:
+        with self._lock:
+            self._evict_expired(time.time())
+            entry = self._entries.get(user_id)
+            return entry[1] if entry else None
+
+    def set(self, user_id: str, values: Tuple):
+        with self._lock:
+            now = time.time()
+            self._evict_expired(now)
+            self._entries[user_id] = (now + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict_expired(self, now: float):
+        """從佇列前端移除已過期的項目（攤銷 O(1)）"""
+        while self._entries:
+            expires_at = next(iter(self._entries.values()))[0]
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+
+
+class MongoStateBackend:
+    """以 MongoDB 儲存狀態，讓多個 worker 與重啟後都能共用同一份狀態
+
+    過期交由 TTL 索引在伺服器端處理，讀取時再以 expires_at 過濾
+    尚未被背景清除的項目。TTL 清除約每 60 秒執行一次，期間的數量上限
+    由寫入時定期檢查：超過 max_entries 時先刪除已過期的項目，
+    仍超過時刪除最早過期的項目，與本地後端的容量淘汰一致。
+    """
+
+    def __init__(self, collection, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.collection = collection
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._indexes_ready = False
+        self._next_capacity_check = 0.0
+
+    def ensure_indexes(self):
+        """建立 TTL 索引（只執行一次）"""
+        if self._indexes_ready:
+            return
+        try:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"狀態 TTL 索引建立警告: {e}")
+        self._indexes_ready = True
+
+    def get(self, user_id: str) -> Optional[Tuple]:
+        doc = self.collection.find_one(
+            {"_id": user_id, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"s": 1},
+        )
+        return tuple(doc["s"]) if doc else None
+
+    def set(self, user_id: str, values: Tuple):
+        self.ensure_indexes()
+        self.collection.update_one(
+            {"_id": user_id},
+            {
+                "$set": {
+                    "s": list(values),
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+                }
+            },
+            upsert=True,
+        )
+        if time.time() >= self._next_capacity_check:
+            self._next_capacity_check = time.time() + CAPACITY_CHECK_INTERVAL
+            self.enforce_capacity()
+
+    def enforce_capacity(self):
+        """數量超過上限時淘汰項目（依 expires_at 索引，不掃描全部用戶）"""
+        try:
+            if self.collection.estimated_document_count() <= self.max_entries:
+                return
+            self.collection.delete_many({"expires_at": {"$lte": datetime.now(timezone.utc)}})
+            excess = self.collection.count_documents({}) - self.max_entries
+            if excess > 0:
+                oldest = [
+                    doc["_id"]
+                    for doc in self.collection.find({}, {"_id": 1}).sort("expires_at", 1).limit(excess)
+                ]
+                self.collection.delete_many({"_id": {"$in": oldest}})
+        except Exception as e:
+            logger.warning(f"狀態容量檢查失敗: {e}")
+
+    def delete(self, user_id: str):
+        self.collection.delete_one({"_id": user_id})
+
+
+def create_state_backend():
+    """依環境變數建立狀態後端
+
+    USER_STATE_BACKEND=mongo 時使用共享的 MongoDB 後端，
+    否則使用單一進程內的本地後端。
+    """
+    backend = os.getenv("USER_STATE_BACKEND", "local").lower()
+    ttl = int(os.getenv("USER_STATE_TTL", DEFAULT_TTL))
+    max_entries = int(os.getenv("USER_STATE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+
+    if backend == "mongo":
+        from models import db
+        return MongoStateBackend(db["user_states"], ttl=ttl, max_entries=max_entries)
+    return LocalStateBackend(ttl=ttl, max_entries=max_entries)
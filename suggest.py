@@ -0,0 +1,206 @@
+"""
+搜尋建議（輸入提示）
+營地名稱、縣市與特色／設施詞彙存於記憶體中的前綴樹，每個節點預先保留權重最高的建議，
+查詢只需沿著輸入的字走到對應節點。營地新增、編輯、刪除時只更新受影響的詞
+"""
+
+import os
+import re
+import heapq
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from geography import classify_location
+from query_normalizer import fold
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", 8))
+NODE_TOP_K = 13  # 每個節點保留的建議數（不小於 SUGGEST_LIMIT 與 LINE 快速回覆上限）
+MAX_PREFIX_LENGTH = 20
+TERM_FIELDS = ("features", "facilities", "sideservice")
+TERM_SEPARATORS = re.compile(r"[,，、/／;；\s]+")
+IGNORED_TERMS = {"未知", "無", "無資訊", "-"}
+
+Term = Tuple[str, str]  # (類型, 顯示文字)
+
+
+def _text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    return str(value) if value else ""
+
+
+def campsite_terms(campsite: Dict[str, Any]) -> set:
+    """營地提供的建議詞：名稱、所在縣市、特色與設施"""
+    terms = set()
+    name = _text(campsite.get("name")).strip()
+    if name:
+        terms.add(("name", name))
+    county = classify_location(_text(campsite.get("location")))["county"]
+    if county:
+        terms.add(("county", county))
+    for field in TERM_FIELDS:
+        for term in TERM_SEPARATORS.split(_text(campsite.get(field))):
+            if 2 <= len(term) <= MAX_PREFIX_LENGTH and term not in IGNORED_TERMS:
+                terms.add(("term", term))
+    return terms
+
+
+def _rank_key(entry):
+    weight, kind, text = entry
+    return (-weight, len(text), text, kind)
+
+
+class _Node:
+    __slots__ = ("children", "terms", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.terms: Dict[Term, int] = {}   # 以此節點結尾的詞與權重
+        self.top: List[Tuple[int, str, str]] = []  # (權重, 類型, 文字)，已排序
+
+
+class SuggestTrie:
+    """帶權重的前綴樹，權重為包含該詞的營地數"""
+
+    def __init__(self, campsites: Iterable[Dict[str, Any]] = ()):
+        self.root = _Node()
+        self.weights: Dict[Term, int] = {}
+        self.campsite_terms: Dict[Any, set] = {}
+        for campsite in campsites:
+            terms = campsite_terms(campsite)
+            self.campsite_terms[campsite["_id"]] = terms
+            for term in terms:
+                self.weights[term] = self.weights.get(term, 0) + 1
+        for term, weight in self.weights.items():
+            self._node(fold(term[1]), create=True).terms[term] = weight
+        self._refresh_all(self.root)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def _node(self, key: str, create: bool = False) -> Optional[_Node]:
+        node = self.root
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _Node()
+            node = child
+        return node
+
+    @staticmethod
+    def _compute_top(node: _Node):
+        entries = [(weight, kind, text) for (kind, text), weight in node.terms.items()]
+        for child in node.children.values():
+            entries.extend(child.top)
+        node.top = heapq.nsmallest(NODE_TOP_K, entries, key=_rank_key)
+
+    def _refresh_all(self, root: _Node):
+        # 後序走訪，子節點的建議先算好
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                self._compute_top(node)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+
+    def _adjust(self, term: Term, delta: int):
+        weight = self.weights.get(term, 0) + delta
+        key = fold(term[1])
+        path = [self.root]
+        for char in key:
+            path.append(path[-1].children.setdefault(char, _Node()))
+        if weight > 0:
+            self.weights[term] = weight
+            path[-1].terms[term] = weight
+        else:
+            self.weights.pop(term, None)
+            path[-1].terms.pop(term, None)
+        # 只重算這個詞路徑上的節點，並移除沒有任何詞的分支
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            self._compute_top(node)
+            if depth and not node.top:
+                del path[depth - 1].children[key[depth - 1]]
+
+    def add_campsite(self, campsite: Dict[str, Any]):
+        terms = campsite_terms(campsite)
+        self.remove_campsite(campsite["_id"])
+        self.campsite_terms[campsite["_id"]] = terms
+        for term in terms:
+            self._adjust(term, 1)
+
+    def remove_campsite(self, campsite_id):
+        for term in self.campsite_terms.pop(campsite_id, ()):
+            self._adjust(term, -1)
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> List[Dict[str, str]]:
+        node = self._node(fold(prefix.strip())[:MAX_PREFIX_LENGTH])
+        if node is None:
+            return []
+        return [{"text": text, "type": kind} for _, kind, text in node.top[:limit]]
+
+
+_trie = {"version": None, "value": None}
+_trie_lock = threading.Lock()
+
+
+def get_suggest_trie() -> SuggestTrie:
+    """取得目前資料版本的前綴樹，其他 worker 變更資料後整個重建"""
+    from models import Campsite, get_data_version
+
+    version = get_data_version()
+    if _trie["version"] != version:
+        with _trie_lock:
+            if _trie["version"] != version:
+                _trie["value"] = SuggestTrie(Campsite.get_facet_fields())
+                _trie["version"] = version
+                logger.info(f"搜尋建議已重建: {len(_trie['value'])} 個詞")
+    return _trie["value"]
+
+
+def campsite_changed(campsite_id, version: int):
+    """本 worker 寫入營地後只更新該營地的詞；中間有其他變更時留待下次查詢重建"""
+    from models import Campsite
+
+    try:
+        with _trie_lock:
+            if _trie["value"] is None or _trie["version"] != version - 1:
+                return
+            campsite = Campsite.get_by_id(campsite_id)
+            if campsite:
+                _trie["value"].add_campsite(campsite)
+            else:
+                _trie["value"].remove_campsite(campsite_id)
+            _trie["version"] = version
+    except Exception as e:
+        logger.warning(f"更新搜尋建議失敗，下次查詢時重建: {e}")
+        _trie["version"] = None
+
+
+def suggest(query: str, limit: int = SUGGEST_LIMIT, relax: bool = False) -> List[Dict[str, str]]:
+    """最後一個關鍵字的建議，其餘關鍵字原樣保留在 query 欄位；空白輸入回傳熱門搜尋
+
+    relax 為 True 時，找不到建議就逐字縮短最後一個關鍵字（用於搜尋沒有結果時）
+    """
+    words = query.split()
+    if not words:
+        # 尚未輸入時提供熱門搜尋
+        from search_telemetry import popular_searches
+        return [{"text": text, "type": "popular", "query": text} for text in popular_searches(limit)]
+    if query[-1].isspace():
+        return []
+    prefix = " ".join(words[:-1])
+    trie = get_suggest_trie()
+    last = words[-1]
+    items = trie.suggest(last, limit)
+    while relax and not items and len(last) > 1:
+        last = last[:-1]
+        items = trie.suggest(last, limit)
+    return [dict(item, query=f"{prefix} {item['text']}".strip()) for item in items]
@@ -0,0 +1,96 @@
+"""
+全文搜尋的 n-gram 索引
+每個營地存一份可搜尋欄位的二字與三字詞陣列（search_tokens），並建立 multikey 索引。
+一般關鍵字先以 $all 在索引上找出候選，再以原本的 regex 確認，避免全表掃描
+
+使用方式（為既有資料補上詞陣列）:
+    python text_index.py
+"""
+
+import os
+import re
+import logging
+from typing import Any, Dict, List
+
+from query_normalizer import fold, variant_pattern
+
+logger = logging.getLogger(__name__)
+
+# 關鍵字搜尋比對的欄位
+SEARCHABLE_FIELDS = ("name", "location", "features", "altitude", "WC", "facilities", "sideservice")
+# ngram：以詞陣列索引縮小範圍；regex：只用 regex 逐筆比對
+TEXT_SEARCH_MODE = os.getenv("TEXT_SEARCH_MODE", "ngram").lower()
+GRAM_SIZES = (2, 3)
+# 查詢時使用的詞長：關鍵字夠長時用三字詞，候選較少
+QUERY_GRAM_SIZE = 3
+
+
+def normalize_text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(item) for item in value)
+    return fold(str(value)) if value else ""
+
+
+def _grams(text: str, size: int):
+    return (text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def document_tokens(campsite: Dict[str, Any]) -> List[str]:
+    """營地所有可搜尋欄位的二字與三字詞（每個欄位各自切詞，不跨欄位）"""
+    tokens = set()
+    for field in SEARCHABLE_FIELDS:
+        text = normalize_text(campsite.get(field))
+        for size in GRAM_SIZES:
+            tokens.update(_grams(text, size))
+    return sorted(tokens)
+
+
+def keyword_tokens(keyword: str) -> List[str]:
+    """關鍵字在文件中出現時必定存在的詞；單字關鍵字無法使用索引，回傳空陣列"""
+    text = normalize_text(keyword)
+    size = min(len(text), QUERY_GRAM_SIZE)
+    if size < min(GRAM_SIZES):
+        return []
+    return sorted(set(_grams(text, size)))
+
+
+def keyword_condition(keyword: str) -> Dict[str, Any]:
+    """一般關鍵字的查詢條件（關鍵字視為文字，不會被當作 regex 編譯）"""
+    regex = re.compile(variant_pattern(keyword), re.IGNORECASE)
+    condition = {"$or": [{field: regex} for field in SEARCHABLE_FIELDS]}
+    tokens = keyword_tokens(keyword)
+    if TEXT_SEARCH_MODE != "ngram" or not tokens:
+        return condition
+    return {
+        "$and": [
+            # 尚未補上詞陣列的舊資料（欄位不存在）也列為候選
+            {"$or": [{"search_tokens": {"$all": tokens}}, {"search_tokens": None}]},
+            condition,
+        ]
+    }
+
+
+def backfill_search_tokens(batch_size: int = 500) -> int:
+    """重新計算所有營地的詞陣列，回傳更新筆數"""
+    from pymongo import UpdateOne
+    from models import collection
+
+    projection = {field: 1 for field in SEARCHABLE_FIELDS}
+    updated = 0
+    batch = []
+    for campsite in collection.find({}, projection):
+        batch.append(
+            UpdateOne({"_id": campsite["_id"]}, {"$set": {"search_tokens": document_tokens(campsite)}})
+        )
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    logger.info(f"已更新 {updated} 個營地的搜尋詞")
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("已更新營地數:", backfill_search_tokens())
@@ -0,0 +1,160 @@
+"""
+營地圖片縮圖
+爬蟲完成後以多進程預先產生固定尺寸的壓縮圖，存放於以內容雜湊命名的目錄
+"""
+
+import os
+import io
+import re
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import requests
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 未安裝時停用縮圖，頁面改用原圖
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = os.getenv(
+    "THUMBNAIL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnails")
+)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "https://camping.ddnsking.com")
+# 圖片服務另外部署時的網址（例如 https://img.example.com），預設與網站同源
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "").rstrip("/")
+MAX_SOURCE_BYTES = 10 * 1024 * 1024  # 與爬蟲的圖片上限一致
+THUMBNAIL_NAME_RE = re.compile(r"^[0-9a-f]{32}\.(webp|jpg)$")
+
+# 縮圖規格：(寬, 高, 格式, 品質, 是否裁切)
+VARIANTS = {
+    # 首頁卡片 200px 高、約 400px 寬，以兩倍解析度輸出
+    "card": (800, 400, "WEBP", 75, True),
+    # LINE Flex hero 20:13，LINE 只支援 JPEG / PNG
+    "hero": (1040, 676, "JPEG", 80, True),
+    # 照片輪播（modal-lg），等比縮小不裁切
+    "modal": (1600, 1200, "WEBP", 80, False),
+}
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+def thumbnail_path(name: str) -> str:
+    """縮圖檔名對應的磁碟路徑（以雜湊前兩碼分目錄）"""
+    return os.path.join(THUMBNAIL_DIR, name[:2], name)
+
+
+def _encode_variant(image, variant: str) -> str:
+    """產生單一縮圖並以內容雜湊命名存檔，回傳檔名"""
+    width, height, fmt, quality, crop = VARIANTS[variant]
+    if crop:
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        resized = image.copy()
+        resized.thumbnail((width, height), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        resized.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+    else:
+        resized.save(buffer, fmt, quality=quality, method=4)
+    data = buffer.getvalue()
+
+    name = f"{hashlib.sha256(data).hexdigest()[:32]}.{EXTENSIONS[fmt]}"
+    path = thumbnail_path(name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    return name
+
+
+def render_thumbnails(url: str, variants: tuple) -> Optional[Dict[str, str]]:
+    """下載一張圖片並產生指定的縮圖（在子進程中執行）"""
+    try:
+        response = requests.get(
+            url, headers={"User-Agent": "Mozilla/5.0"}, stream=True, timeout=(3.05, 15)
+        )
+        response.raise_for_status()
+        data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(data) > MAX_SOURCE_BYTES:
+            logger.info(f"圖片太大，略過縮圖: {url}")
+            return None
+
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        result = {"url": url}
+        for variant in variants:
+            result[variant] = _encode_variant(image, variant)
+        return result
+    except Exception as e:
+        logger.warning(f"產生縮圖失敗: {url}, 錯誤: {e}")
+        return None
+
+
+def generate_thumbnails(campsites: List[Dict[str, Any]], max_workers: Optional[int] = None) -> int:
+    """為營地的圖片產生縮圖並寫回資料庫，回傳處理的營地數"""
+    if Image is None:
+        logger.warning("未安裝 Pillow，略過縮圖產生")
+        return 0
+
+    from models import Campsite, bump_data_version, cache
+
+    jobs = []
+    for campsite in campsites:
+        for index, url in enumerate(campsite.get("image_urls") or []):
+            if url.startswith(("http://", "https://")):
+                # 卡片與 LINE hero 只用到第一張圖片
+                variants = ("card", "hero", "modal") if index == 0 else ("modal",)
+                jobs.append((campsite["_id"], url, variants))
+    if not jobs:
+        return 0
+
+    thumbnails = {}
+    # 以 spawn 啟動子進程，不複製呼叫端的 MongoClient 與執行緒狀態
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        results = executor.map(
+            render_thumbnails, [url for _, url, _ in jobs], [variants for _, _, variants in jobs]
+        )
+        for (campsite_id, _, _), result in zip(jobs, results):
+            if result:
+                thumbnails.setdefault(campsite_id, []).append(result)
+
+    for campsite_id, items in thumbnails.items():
+        Campsite.set_thumbnails(campsite_id, items)
+    cache.clear()
+    bump_data_version()
+    logger.info(f"已為 {len(thumbnails)} 個營地產生縮圖")
+    return len(thumbnails)
+
+
+def generate_missing_thumbnails(max_workers: Optional[int] = None) -> int:
+    """為尚未產生縮圖（或圖片編輯後縮圖已移除）的營地補產生縮圖"""
+    from models import Campsite
+    return generate_thumbnails(Campsite.get_without_thumbnails(), max_workers)
+
+
+def thumbnail_url(campsite: Dict[str, Any], variant: str, index: int = 0,
+                  external: bool = False) -> Optional[str]:
+    """取得營地第 index 張圖片的縮圖網址，沒有對應縮圖時回傳 None"""
+    image_urls = campsite.get("image_urls") or []
+    if index >= len(image_urls):
+        return None
+    for item in campsite.get("thumbnails") or []:
+        # 以原圖網址比對，圖片被編輯後舊縮圖自然失效
+        if item.get("url") == image_urls[index] and item.get(variant):
+            path = f"/thumbs/{item[variant]}"
+            return f"{IMAGE_BASE_URL or PUBLIC_BASE_URL}{path}" if external else f"{IMAGE_BASE_URL}{path}"
+    return None
+
+
+if __name__ == "__main__":
+    # 直接執行時為所有缺少縮圖的營地補產生縮圖
+    logging.basicConfig(level=logging.INFO)
+    print("已處理營地數:", generate_missing_thumbnails())